@@ -0,0 +1,145 @@
+import datetime
+import json
+import os
+import random
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from snmp_utils import DeviceSnapshot, OidProfile, IF_NAME_OID, IF_OPER_STATUS_OID, IF_ALIAS_OID, decode_date_and_time, naive_epoch, parse_core_macs
+from onu_utils import OnuDeregTracker
+from naming_utils import transform_host_name, classify_port_description, SWITCH_UPLINK_MARKERS
+
+FDB_SIZE = 30000
+ONU_COUNT = 4000
+EXCEPTIONS_COUNT = 500
+PORT_COUNT = 52
+
+random.seed(1302)
+
+
+class ColumnFetcher:
+    # Заміна SnmpTableFetcher, що віддає заздалегідь згенеровану колонку
+    def __init__(self, column):
+        self.column = column
+
+    def get_column(self, base_oid):
+        return self.column
+
+
+def make_fdb_column(size=FDB_SIZE):
+    column = {}
+    while len(column) < size:
+        octets = random.getrandbits(48).to_bytes(6, 'big')
+        column['10.' + '.'.join(str(octet) for octet in octets)] = str(random.randint(1, PORT_COUNT))
+    return column
+
+
+def make_dereg_values(count=ONU_COUNT):
+    now = datetime.datetime.now()
+    values = []
+    for _ in range(count):
+        moment = now - datetime.timedelta(seconds=random.randint(0, 86400 * 30))
+        values.append(struct.pack('>HBBBBBBcBB', moment.year, moment.month, moment.day, moment.hour, moment.minute, moment.second, 0, b'+', 2, 0).decode('latin-1'))
+    return values
+
+
+def make_descriptions(count=PORT_COUNT * 20):
+    templates = ["client_{}", "tr_{}", "sw-te-{}-1.te.clb", "gw-te-{}", "olt-te-{}", "uplink {}", ""]
+    return [random.choice(templates).format(i) for i in range(count)]
+
+
+def make_exceptions(count=EXCEPTIONS_COUNT):
+    return [(f"knock-sw-te-{i}.te.clb", f"sw-te-{i}-1.te.clb") for i in range(count)]
+
+
+def bench_fdb_snapshot():
+    fetcher = ColumnFetcher(make_fdb_column())
+    core_macs = parse_core_macs([random.getrandbits(48) for _ in range(4)])
+    profile = OidProfile("bench", {'if_name': IF_NAME_OID, 'oper_status': IF_OPER_STATUS_OID, 'alias': IF_ALIAS_OID})
+
+    def run():
+        snapshot = DeviceSnapshot(fetcher, profile)
+        snapshot.find_port(core_macs)
+    return run
+
+
+def bench_decode_date_and_time():
+    values = make_dereg_values()
+    return lambda: decode_date_and_time(values)
+
+
+def bench_check_power_issues():
+    values = make_dereg_values()
+    dereg_times = dict(zip(range(len(values)), decode_date_and_time(values)))
+    now = naive_epoch(datetime.datetime.now())
+
+    def run():
+        tracker = OnuDeregTracker()
+        tracker.update(dereg_times, now)
+        tracker.has_mass_deregistration(now)
+    return run
+
+
+def bench_classify_port_description():
+    descriptions = make_descriptions()
+    return lambda: [classify_port_description(description, SWITCH_UPLINK_MARKERS) for description in descriptions]
+
+
+def bench_transform_host_name():
+    exceptions = make_exceptions()
+    host_names = [f"knock-sw-te-{i}.te.clb" for i in range(0, EXCEPTIONS_COUNT * 2, 7)]
+    return lambda: [transform_host_name(host_name, exceptions) for host_name in host_names]
+
+
+BENCHMARKS = {
+    'fdb_snapshot': (bench_fdb_snapshot, 5),
+    'decode_date_and_time': (bench_decode_date_and_time, 20),
+    'check_power_issues': (bench_check_power_issues, 20),
+    'classify_port_description': (bench_classify_port_description, 200),
+    'transform_host_name': (bench_transform_host_name, 20),
+}
+
+
+def run_benchmarks(names):
+    results = {}
+    for name in names:
+        make_benchmark, number = BENCHMARKS[name]
+        func = make_benchmark()
+        best = min(timeit.repeat(func, number=number, repeat=5)) / number
+        results[name] = best
+        print(f"{name:<28} {best * 1000:10.3f} ms")
+    return results
+
+
+def compare(results, baseline_path, tolerance=0.2):
+    with open(baseline_path, "r") as file:
+        baseline = json.load(file)
+    regressions = []
+    for name, seconds in results.items():
+        if name in baseline and seconds > baseline[name] * (1 + tolerance):
+            regressions.append(name)
+            print(f"РЕГРЕСІЯ {name}: {baseline[name] * 1000:.3f} ms -> {seconds * 1000:.3f} ms")
+    return regressions
+
+
+if __name__ == "__main__":
+    # python benchmarks/bench_hot_paths.py [назви...] [--save файл.json] [--compare файл.json]
+    args = sys.argv[1:]
+    save_path = compare_path = None
+    if '--save' in args:
+        save_path = args.pop(args.index('--save') + 1)
+        args.remove('--save')
+    if '--compare' in args:
+        compare_path = args.pop(args.index('--compare') + 1)
+        args.remove('--compare')
+
+    results = run_benchmarks(args or list(BENCHMARKS))
+
+    if save_path:
+        with open(save_path, "w") as file:
+            json.dump(results, file, indent=2)
+    if compare_path and compare(results, compare_path):
+        sys.exit(1)
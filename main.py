@@ -1,9 +1,17 @@
 from easysnmp import Session, EasySNMPError, EasySNMPTimeoutError
-from zabbix_utils import get_switch_ip, get_zabbix_triggers, transform_host_name, get_region
+from zabbix_utils import get_switch_ip, get_switch_ip_resolver, get_zabbix_triggers, get_region, get_zabbix_api
+from naming_utils import transform_host_name, classify_port_description, BDCOM_UPLINK_MARKERS, SWITCH_UPLINK_MARKERS
 from billing_utils import add_TD, close_TD
+from snmp_utils import SnmpTableFetcher, DeviceSnapshot, OidProfile, IF_NAME_OID, IF_OPER_STATUS_OID, IF_ALIAS_OID, INDEX_LAST, INDEX_RAW, run_snmp, configure_snmp_executor, configure_snmp_timeouts, configure_session_pool, device_timeouts, session_pool, parse_core_macs, configure_uplink_lookup, find_uplink_port, mac_from_index, decode_date_and_time, naive_epoch
+from topology_utils import TopologyTraversal, TopologyStore, TraversalMemo
+from webhook_utils import WebhookReceiver
+from onu_utils import get_onu_tracker
+from vendor_utils import DriverProfile, DriverRegistry, SYS_DESCR_OID, SYS_OBJECT_ID_OID
+from metrics_utils import metrics, serve_metrics, SamplingProfiler
+from reachability_utils import DeviceUnreachable, circuit_breaker, configure_circuit_breaker
+from queue_utils import JobQueue, FAILED, encode_trigger, decode_trigger, worker_name
+from scheduler_utils import TriggerScheduler
 import datetime
-import struct
-import re
 import time
 import configparser
 import multiprocessing
@@ -21,43 +29,42 @@ class SwitchFactory:
         self.zabbix_password = zabbix_password
 
         try:
-            # Виконати підключення до комутатора
-            model_oid = "1.3.6.1.2.1.1.1.0"
-            self.session = Session(hostname=self.ip, community=self.community_string, version=self.version)
-            model_value = self.session.get(model_oid).value
-            print(model_value)
-            
-            # Перевірити тип комутатора і повернути відповідний об'єкт
-            if "D-Link" in model_value or "DES" in model_value or "DGS" in model_value:
-                return Dlink(self.ip, self.community_string, self.version, self.core_mac_address, self.zabbix_url, self.zabbix_user, self.zabbix_password)
-            elif "ECS" in model_value or "Edge" in model_value:
-                return Edge_Core(self.ip, self.community_string, self.version, self.core_mac_address, self.zabbix_url, self.zabbix_user, self.zabbix_password)
-            elif "BDCOM" in model_value and "GP3600" in model_value: 
-                return BDCOM(self.ip, self.community_string, self.version, self.core_mac_address, self.zabbix_url, self.zabbix_user, self.zabbix_password, "GPON")
-            elif "BDCOM" in model_value and "GP3600" not in model_value and "3310B" not in model_value: 
-                return BDCOM(self.ip, self.community_string, self.version, self.core_mac_address, self.zabbix_url, self.zabbix_user, self.zabbix_password, "EPON")
-            elif "BDCOM" in model_value and "3310B" in model_value: 
-                return BDCOM(self.ip, self.community_string, self.version, self.core_mac_address, self.zabbix_url, self.zabbix_user, self.zabbix_password, "3310B")
-            elif "MGS" in model_value: 
-                return Zyxel(self.ip, self.community_string, self.version, self.core_mac_address, self.zabbix_url, self.zabbix_user, self.zabbix_password)
-            else:
+            # Тип комутатора береться з кешу або визначається за sysDescr/sysObjectID
+            profile = driver_registry.detect(self.ip, partial(probe_device, community_string=self.community_string, version=self.version))
+            if profile is None:
                 return None
+            return profile.create(self.ip, self.community_string, self.version, self.core_mac_address, self.zabbix_url, self.zabbix_user, self.zabbix_password)
 
+        except (EasySNMPTimeoutError, TimeoutError):
+            # Таймаут і запобіжник враховує обхід, який викликав фабрику
+            print("Комутатор недоступний (timed out while connecting to remote host).")
+            raise
         except EasySNMPError as e:
-            # Опрацювати помилку EasySNMPError
+            # Опрацювати помилку EasySNMPError; тип пристрою визначиться заново при наступному візиті
             print("Помилка EasySNMP: ", e)
+            driver_registry.forget(self.ip)
             return None
-        except TimeoutError:
-            # Обробити помилку зв'язку
-            print("Комутатор недоступний (timed out while connecting to remote host).")
-            return None
-            
+
+
+def open_session(owner, ip, community, version, **options):
+    # Сесія береться з пулу і повертається туди, коли драйвер-власник більше не потрібен.
+    # Таймаут і кількість повторів беруться з однієї політики для всіх драйверів
+    return session_pool.borrow(owner, ip, community, version, **options)
+
+
+def probe_device(ip, community_string, version):
+    with session_pool.session(ip, community_string, version) as session:
+        start = time.perf_counter()
+        sys_descr, sys_object_id = session.get([SYS_DESCR_OID, SYS_OBJECT_ID_OID])
+    device_timeouts.record_rtt(ip, time.perf_counter() - start)
+    return sys_descr.value, sys_object_id.value
+
 class BDCOM_LOC_POW:
     def __init__(self, ip_address, community, version, core_mac_address, zabbix_url, zabbix_user, zabbix_password):
         self.ip = ip_address
         self.community_string = community
         self.version = version
-        self.core_mac_address = core_mac_address
+        self.core_mac_address = parse_core_macs(core_mac_address)
         self.zabbix_url= zabbix_url
         self.zabbix_user = zabbix_user
         self.zabbix_password = zabbix_password
@@ -72,42 +79,42 @@ class BDCOM_LOC_POW:
         self.snmp_oid_onu_lastderegtime = '1.3.6.1.4.1.3320.101.11.1.1.10'
 
 
-        self.session = Session(hostname=self.ip, community=community, version=self.version, use_enums=True)
+        self.session = open_session(self, self.ip, community, self.version, use_enums=True)
+        self.snmp = SnmpTableFetcher(self.session, 50)
 
     def get_onu_dereg_time(self):
-        deregistration_times = self.session.walk(self.snmp_oid_onu_lastderegtime)
-        onu_dereg_time = {}
-
-        for index, dereg_oid in enumerate(deregistration_times):
-            dereg_variable = self.session.get(dereg_oid.oid)
-            dereg_value = dereg_variable.value
-            dereg_time = [ord(char) for char in dereg_value]
-            dereg_year, dereg_month, dereg_day, dereg_hour, dereg_minute, dereg_second = struct.unpack('>HBBBBB', bytes(dereg_time[0:7]))
-            dereg_time_str = f"{dereg_year}-{dereg_month:02d}-{dereg_day:02d} {dereg_hour:02d}:{dereg_minute:02d}:{dereg_second:02d}"
-            mac_address_oid = dereg_oid.oid.split('.')[-6:]
-            mac_address_list = [int(x) for x in mac_address_oid]
-            mac_address_str = ':'.join(['{:02X}'.format(x) for x in mac_address_list])
-
-            if mac_address_str not in onu_dereg_time:
-                onu_dereg_time[mac_address_str] = []
-            onu_dereg_time[mac_address_str] = dereg_time_str
-        return onu_dereg_time
+        # Один прохід GETBULK по таблиці; ключ - MAC ONU як ціле, значення - naive_epoch
+        deregistration_times = self.snmp.get_column(self.snmp_oid_onu_lastderegtime)
+        mac_addresses = [mac_from_index(index) for index in deregistration_times]
+        dereg_epochs = decode_date_and_time(deregistration_times.values())
+        return dict(zip(mac_addresses, dereg_epochs))
     
 
-    def check_power_issues(self, device_data):
-            registration_counts = {}
-            current_time = datetime.datetime.now()
-
-            for mac_address, registration_time_str in device_data.items():
-                registration_time = datetime.datetime.strptime(registration_time_str, '%Y-%m-%d %H:%M:%S')
-                if current_time - registration_time <= datetime.timedelta(minutes=10):
-                    registration_time_floor = registration_time.replace(second=0, microsecond=0)
-                    registration_counts[registration_time_floor] = registration_counts.get(registration_time_floor, 0) + 1
-
-            for count in registration_counts.values():
-                if count >= 2:
-                    return True
-            return False
+    def check_power_issues(self, device_data=None, max_age=30):
+            # Чи є хвилина за останні 10 хвилин, у яку відвалилось щонайменше 2 ONU.
+            # Відповідь береться з кешу OLT; таблиця перечитується лише коли кеш застарів
+            now = naive_epoch(datetime.datetime.now())
+            tracker = get_onu_tracker(self.ip)
+            if device_data is None and tracker.is_stale(max_age):
+                device_data = self.get_onu_dereg_time()
+            if device_data is not None:
+                changed = tracker.update(device_data, now)
+                print(f"{self.ip}: змінився час дереєстрації {changed} ONU")
+
+            return tracker.has_mass_deregistration(now, 600, 2)
+
+
+# Таблиці, які читає кожен драйвер під час візиту, і правила відбору фізичних портів
+SWITCH_OIDS = OidProfile("switch", {'if_name': IF_NAME_OID, 'oper_status': IF_OPER_STATUS_OID, 'alias': IF_ALIAS_OID})
+DLINK_OIDS = SWITCH_OIDS.derive("dlink", port_pattern=r'^[^/]*/(\d+)$', port_count="max")
+EDGE_CORE_OIDS = SWITCH_OIDS.derive("edge_core", port_pattern=r'Port\s*\d+$')
+ZYXEL_OIDS = SWITCH_OIDS.derive("zyxel", port_pattern=r'^swp')
+BDCOM_OIDS = SWITCH_OIDS.derive("bdcom", port_pattern=r'^T?GigaEthernet\d+/\d+', max_repetitions=50)
+BDCOM_TECHNOLOGY_OIDS = {
+    "EPON": BDCOM_OIDS.derive("bdcom_epon", {'active_onu': "1.3.6.1.4.1.3320.101.6.1.1.21"}, {'active_onu': INDEX_RAW}),
+    "GPON": BDCOM_OIDS.derive("bdcom_gpon", {'active_onu': "1.3.6.1.4.1.3320.10.2.1.1.4"}, {'active_onu': INDEX_RAW}),
+    "3310B": BDCOM_OIDS.derive("bdcom_3310b", {'onu_status': "1.3.6.1.4.1.3320.101.10.1.1.26"}, {'onu_status': INDEX_LAST}, fdb="1.3.6.1.4.1.3320.152.1.1.1"),
+}
 
 
 class BDCOM:
@@ -115,55 +122,30 @@ class BDCOM:
         self.ip = ip_address
         self.community_string = community
         self.version = version
-        self.core_mac_address = core_mac_address
+        self.core_mac_address = parse_core_macs(core_mac_address)
         self.zabbix_url= zabbix_url
         self.zabbix_user = zabbix_user
         self.zabbix_password = zabbix_password
         self.technology = technology
+        self.oid_profile = BDCOM_TECHNOLOGY_OIDS[technology]
 
-        self.snmp_oid_active_onu = "1.3.6.1.4.1.3320.101.6.1.1.21."
-        self.snmp_oid_active_onu_gpon = "1.3.6.1.4.1.3320.10.2.1.1.4"
-        self.snmp_oid_status_port = "1.3.6.1.2.1.2.2.1.8."
-        self.snmp_oid_port_description = "1.3.6.1.2.1.31.1.1.1.18."
-        self.snmp_oid_mac_port = "1.3.6.1.2.1.17.7.1.2.2.1.2."
-        self.snmp_oid_mac_port_3310b = "1.3.6.1.4.1.3320.152.1.1.1"
-        self.snmp_oid_all_interfaces = "1.3.6.1.2.1.31.1.1.1.1."
-        self.snmp_oid_onu_status = '1.3.6.1.4.1.3320.101.10.1.1.26.'
-        self.snmpoid_oid_all_onu = '1.3.6.1.4.1.3320.101.9.1.1.1.'
-        self.snmp_oid_onu_lastderegtime = '1.3.6.1.4.1.3320.101.11.1.1.10'
-
-        self.session = Session(hostname=self.ip, community=community, version=self.version, use_enums=True, timeout=30)
+        self.session = open_session(self, self.ip, community, self.version, use_enums=True)
+        self.snmp = SnmpTableFetcher(self.session, self.oid_profile.max_repetitions)
+        self.snapshot = DeviceSnapshot(self.snmp, self.oid_profile)
 
     
     def get_number_ports(self):
-        all_interfaces = self.session.walk(self.snmp_oid_all_interfaces)
-        physical_ports = filter(lambda port: re.match(r'[T]?GigaEthernet\d+/\d+', port.value), all_interfaces)
-        port_numbers = [int(re.search(r'\d+', port.value).group()) for port in physical_ports]
-        return len(port_numbers)
+        return self.snapshot.port_count
 
 
     def get_onu_status(self):
-        all_status_onu = self.session.walk(self.snmp_oid_onu_status)
-        
-        onu_status_dict = {}
-
-        for snmp_variable in all_status_onu:
-            oid_index = snmp_variable.oid.split('.')[-1]
-            value = snmp_variable.value
-            onu_status_dict[int(oid_index)] = value
-
-        return onu_status_dict
+        return self.snapshot.column('onu_status')
 
 
     def get_active_onu(self):
-        if self.technology == "EPON":
-            active_onu = self.session.walk(self.snmp_oid_active_onu)
-            values = [int(var.value) for var in active_onu]
-            total_sum = sum(values)
-            return total_sum
-        if self.technology == "GPON":
-            active_onu = self.session.walk(self.snmp_oid_active_onu_gpon)
-            values = [int(var.value) for var in active_onu]
+        if self.technology in ("EPON", "GPON"):
+            active_onu = self.snapshot.column('active_onu').values()
+            values = [int(value) for value in active_onu]
             total_sum = sum(values)
             return total_sum
         if self.technology == "3310B":
@@ -179,9 +161,8 @@ class BDCOM:
 
     def get_numbers_ports(self, port):
         port_numbers_dict = {}
-        for oid_data in self.session.walk(self.snmp_oid_all_interfaces):
-            port_number = int(oid_data.oid.split(".")[-1])
-            port_numbers_dict[port_number] = oid_data.value
+        for port_number, value in self.snapshot.if_name.items():
+            port_numbers_dict[port_number] = value
         return port_numbers_dict if port == 'All' else {port: port_numbers_dict.get(port)}
     
 
@@ -197,9 +178,10 @@ class BDCOM:
         else:
             raise ValueError("Так має бути")
 
+        description_all_ports = self.snapshot.alias
+
         for i in port_range:
-            description_all_ports = self.session.get(self.snmp_oid_port_description + str(i)).value
-            port_description = self._classify_port_description(description_all_ports)
+            port_description = self._classify_port_description(description_all_ports.get(i, ''))
             port_description_dict[i] = port_description
 
         return port_description_dict
@@ -207,49 +189,29 @@ class BDCOM:
 
     
     def _classify_port_description(self, description):
-        if "client" in description or "tr_" in description:
-            return "client"
-        elif "sw-" in description or "gw-" in description or "olt-" in description:
-            return description
-        else:
-            return None
+        return classify_port_description(description, BDCOM_UPLINK_MARKERS)
     
     
     def get_status_ports(self):
         port_status_dict = {}
         numbers_ports = self.get_numbers_ports('All')
         i = next(iter(numbers_ports))
-        for i, port in enumerate(range(i, self.get_number_ports() + i), start=i):
-            status_port = self.session.get(self.snmp_oid_status_port + str(port)).value
-            port_status = "up" if status_port == '1' else "down"
-            port_status_dict[i] = port_status
+        status_all_ports = self.snapshot.oper_status
+        for port in range(i, self.get_number_ports() + i):
+            port_status = "up" if status_all_ports.get(port) == '1' else "down"
+            port_status_dict[port] = port_status
         return port_status_dict
 
 
     def get_mac_ports(self):
-        port_mac_dict = {}
-        if self.technology == "EPON" or self.technology == "GPON":
-            mac_all_ports = self.session.bulkwalk("1.3.6.1.2.1.17.7.1.2.2.1.2")
-        elif self.technology == "3310B":
-            mac_all_ports = self.session.bulkwalk(self.snmp_oid_mac_port_3310b)
-
-        for var in mac_all_ports:
-            port_number = int(var.value)
-            mac_address_oid = var.oid.split('.')[-6:]
-            mac_address_list = [int(x) for x in mac_address_oid]
-            mac_address_str = ':'.join(['{:02X}'.format(x) for x in mac_address_list])
-            if port_number not in port_mac_dict:
-                port_mac_dict[port_number] = []
-
-            port_mac_dict[port_number].append(mac_address_str)
-
-        return port_mac_dict
+        return self.snapshot.fdb
     
 
     def search_uplink(self):
-         mac_ports = self.get_mac_ports()
-         result = {port: mac for port, mac_list in mac_ports.items() for mac in core_mac_dict if mac in mac_list}
-         return self.get_description_ports(next(iter(result)))
+        port = find_uplink_port(self.ip, self.snapshot, self.core_mac_address)
+        if port is None:
+            return None
+        return self.get_description_ports(port)
     
     def get_switches(self):
         port_descriptions = self.get_description_ports("All")
@@ -277,82 +239,55 @@ class BDCOM:
 
 
 class Edge_Core:
+    oid_profile = EDGE_CORE_OIDS
+
     def __init__(self, ip_address, community, version, core_mac_address, zabbix_url, zabbix_user, zabbix_password):
         self.ip = ip_address
         self.community_string = community
         self.version = version
-        self.core_mac_address = core_mac_address
+        self.core_mac_address = parse_core_macs(core_mac_address)
         self.zabbix_url= zabbix_url
         self.zabbix_user = zabbix_user
         self.zabbix_password = zabbix_password
 
-        self.snmp_oid_status_port = "1.3.6.1.2.1.31.1.1.1.1."
-        self.snmp_oid_all_interfaces = "1.3.6.1.2.1.2.2.1.8."
-        self.snmp_oid_port_description = "1.3.6.1.2.1.31.1.1.1.18."
-        self.snmp_oid_mac_port = "1.3.6.1.2.1.17.7.1.2.2.1.2."
-
-        self.session = Session(hostname=self.ip, community=community, version=self.version)
+        self.session = open_session(self, self.ip, community, self.version)
+        self.snmp = SnmpTableFetcher(self.session, self.oid_profile.max_repetitions)
+        self.snapshot = DeviceSnapshot(self.snmp, self.oid_profile)
 
 
     def get_number_ports(self):
-        all_interfaces = self.session.walk(self.snmp_oid_status_port)
-        physical_ports = filter(lambda port: 'Port' in port.value, all_interfaces)
-        port_numbers = [int(port.value.replace('Port', '')) for port in physical_ports if any(char.isdigit() for char in port.value)]
-        return len(port_numbers)
+        return self.snapshot.port_count
 
 
     def get_status_ports(self):
         port_status_dict = {}
-        for i, port in enumerate(range(1, self.get_number_ports() + 1), start=1):
-            status_port = self.session.get(self.snmp_oid_all_interfaces + str(port)).value
-            port_status = "up" if status_port == '1' else "down"
-            port_status_dict[i] = port_status
+        status_all_ports = self.snapshot.oper_status
+        for port in range(1, self.get_number_ports() + 1):
+            port_status = "up" if status_all_ports.get(port) == '1' else "down"
+            port_status_dict[port] = port_status
 
         return port_status_dict
 
     def get_description_ports(self, port):
         port_description_dict = {}
+        description_all_ports = self.snapshot.alias
         for i in range(1, self.get_number_ports() + 1):
-            description_all_ports = self.session.get(self.snmp_oid_port_description + str(i)).value
-            port_description = self._classify_port_description(description_all_ports)
+            port_description = self._classify_port_description(description_all_ports.get(i, ''))
             port_description_dict[i] = port_description
 
         return port_description_dict if port == 'All' else port_description_dict.get(port)
 
     def _classify_port_description(self, description):
-        if "client" in description or "tr_" in description:
-            return "client"
-        elif "sw-" in description or "gw-" in description or "olt-" in description:
-            return description
-        else:
-            return None
+        return classify_port_description(description, BDCOM_UPLINK_MARKERS)
     
     def get_mac_ports(self):
-        port_mac_dict = {}
-        mac_all_ports = self.session.walk(self.snmp_oid_mac_port)
-
-        for var in mac_all_ports:
-            port_number = int(var.value)
-            mac_address_oid = var.oid.split('.')[-6:]
-            mac_address_list = [int(x) for x in mac_address_oid]
-            mac_address_str = ':'.join(['{:02X}'.format(x) for x in mac_address_list])
-            if port_number not in port_mac_dict:
-                port_mac_dict[port_number] = []
-
-            port_mac_dict[port_number].append(mac_address_str)
-
-        return port_mac_dict
+        return self.snapshot.fdb
 
     def search_uplink(self):
-        uplink_port_data = {}
-        mac_ports = self.get_mac_ports()
-
-        for port, mac_list in mac_ports.items():
-            if any(core_mac in mac_list for core_mac in self.core_mac_address):
-                uplink_port_data[port] = self.get_description_ports(port)
-                return uplink_port_data
-
-        return None
+        port = find_uplink_port(self.ip, self.snapshot, self.core_mac_address)
+        if port is None:
+            return None
+        return {port: self.get_description_ports(port)}
     
     def get_switches(self):
         port_descriptions = self.get_description_ports("All")
@@ -379,79 +314,53 @@ class Edge_Core:
         return active_user_count     
 
 class Dlink:
+    oid_profile = DLINK_OIDS
+
     def __init__(self, ip_address, community, version, core_mac_address, zabbix_url, zabbix_user, zabbix_password):
         self.ip = ip_address
         self.community_string = community
         self.version = version
-        self.core_mac_address = core_mac_address
+        self.core_mac_address = parse_core_macs(core_mac_address)
         self.zabbix_url= zabbix_url
         self.zabbix_user = zabbix_user
         self.zabbix_password = zabbix_password
 
-        self.snmp_oid_status_port = "1.3.6.1.2.1.31.1.1.1.1."
-        self.snmp_oid_all_interfaces = "1.3.6.1.2.1.2.2.1.8."
-        self.snmp_oid_port_description = "1.3.6.1.2.1.31.1.1.1.18."
-        self.snmp_oid_mac_port = "1.3.6.1.2.1.17.7.1.2.2.1.2."
-
-        self.session = Session(hostname=self.ip, community=community, version=self.version)
+        self.session = open_session(self, self.ip, community, self.version)
+        self.snmp = SnmpTableFetcher(self.session, self.oid_profile.max_repetitions)
+        self.snapshot = DeviceSnapshot(self.snmp, self.oid_profile)
 
     def get_number_ports(self):
-        all_interfaces = self.session.walk(self.snmp_oid_status_port)
-        port_numbers = [int(port.value.split('/')[1]) for port in all_interfaces if '/' in port.value and port.value.count('/') == 1]
-        return max(port_numbers) if port_numbers else 0
+        return self.snapshot.port_count
 
     def get_status_ports(self):
         port_status_dict = {}
-        for i, port in enumerate(range(1, self.get_number_ports() + 1), start=1):
-            status_port = self.session.get(self.snmp_oid_all_interfaces + str(port)).value
-            port_status = "up" if status_port == '1' else "down"
-            port_status_dict[i] = port_status
+        status_all_ports = self.snapshot.oper_status
+        for port in range(1, self.get_number_ports() + 1):
+            port_status = "up" if status_all_ports.get(port) == '1' else "down"
+            port_status_dict[port] = port_status
 
         return port_status_dict
 
     def get_description_ports(self, port):
         port_description_dict = {}
+        description_all_ports = self.snapshot.alias
         for i in range(1, self.get_number_ports() + 1):
-            description_all_ports = self.session.get(self.snmp_oid_port_description + str(i)).value
-            port_description = self._classify_port_description(description_all_ports)
+            port_description = self._classify_port_description(description_all_ports.get(i, ''))
             port_description_dict[i] = port_description
 
         return port_description_dict if port == 'All' else port_description_dict.get(port)
 
     def _classify_port_description(self, description):
-        if "client" in description or "tr_" in description:
-            return "client"
-        elif "sw-" in description or "gw-" in description or "sr-te" in description:
-            return description
-        else:
-            return None
+        return classify_port_description(description, SWITCH_UPLINK_MARKERS)
 
     def get_mac_ports(self):
-        port_mac_dict = {}
-        mac_all_ports = self.session.walk(self.snmp_oid_mac_port)
-
-        for var in mac_all_ports:
-            port_number = int(var.value)
-            mac_address_oid = var.oid.split('.')[-6:]
-            mac_address_list = [int(x) for x in mac_address_oid]
-            mac_address_str = ':'.join(['{:02X}'.format(x) for x in mac_address_list])
-            if port_number not in port_mac_dict:
-                port_mac_dict[port_number] = []
-
-            port_mac_dict[port_number].append(mac_address_str)
-
-        return port_mac_dict
+        return self.snapshot.fdb
 
     def search_uplink(self):
-        uplink_port_data = {}
-        mac_ports = self.get_mac_ports()
-
-        for port, mac_list in mac_ports.items():
-            if any(core_mac in mac_list for core_mac in self.core_mac_address):
-                uplink_port_data[port] = self.get_description_ports(port)
-                return uplink_port_data
-
-        return None
+        port = find_uplink_port(self.ip, self.snapshot, self.core_mac_address)
+        if port is None:
+            return None
+        return {port: self.get_description_ports(port)}
     
     def get_switches(self):
         port_descriptions = self.get_description_ports("All")
@@ -478,80 +387,53 @@ class Dlink:
         return active_user_count
  
 class Zyxel :
+    oid_profile = ZYXEL_OIDS
 
     def __init__(self, ip_address, community, version, core_mac_address, zabbix_url, zabbix_user, zabbix_password):
         self.ip = ip_address
         self.community_string = community
         self.version = version
-        self.core_mac_address = core_mac_address
+        self.core_mac_address = parse_core_macs(core_mac_address)
         self.zabbix_url= zabbix_url
         self.zabbix_user = zabbix_user
         self.zabbix_password = zabbix_password
 
-        self.snmp_oid_status_port = "1.3.6.1.2.1.31.1.1.1.1."
-        self.snmp_oid_all_interfaces = "1.3.6.1.2.1.2.2.1.8."
-        self.snmp_oid_port_description = "1.3.6.1.2.1.31.1.1.1.18."
-        self.snmp_oid_mac_port = "1.3.6.1.2.1.17.7.1.2.2.1.2."
-
-        self.session = Session(hostname=self.ip, community=community, version=self.version)
+        self.session = open_session(self, self.ip, community, self.version)
+        self.snmp = SnmpTableFetcher(self.session, self.oid_profile.max_repetitions)
+        self.snapshot = DeviceSnapshot(self.snmp, self.oid_profile)
 
     def get_number_ports(self):
-        all_interfaces = self.session.walk(self.snmp_oid_status_port)
-        port_numbers = [interface.value.split("swp")[1] for interface in all_interfaces if interface.value.startswith("swp")]
-        return len(port_numbers)
+        return self.snapshot.port_count
 
     def get_status_ports(self):
         port_status_dict = {}
-        for i, port in enumerate(range(1, self.get_number_ports() + 1), start=1):
-            status_port = self.session.get(self.snmp_oid_all_interfaces + str(port)).value
-            port_status = "up" if status_port == '1' else "down"
-            port_status_dict[i] = port_status
+        status_all_ports = self.snapshot.oper_status
+        for port in range(1, self.get_number_ports() + 1):
+            port_status = "up" if status_all_ports.get(port) == '1' else "down"
+            port_status_dict[port] = port_status
 
         return port_status_dict
 
     def get_description_ports(self, port):
         port_description_dict = {}
+        description_all_ports = self.snapshot.alias
         for i in range(1, self.get_number_ports() + 1):
-            description_all_ports = self.session.get(self.snmp_oid_port_description + str(i)).value
-            port_description = self._classify_port_description(description_all_ports)
+            port_description = self._classify_port_description(description_all_ports.get(i, ''))
             port_description_dict[i] = port_description
 
         return port_description_dict if port == 'All' else port_description_dict.get(port)
 
     def _classify_port_description(self, description):
-        if "client" in description or "tr_" in description:
-            return "client"
-        elif "sw-" in description or "gw-" in description or "sr-te" in description:
-            return description
-        else:
-            return None
+        return classify_port_description(description, SWITCH_UPLINK_MARKERS)
 
     def get_mac_ports(self):
-        port_mac_dict = {}
-        mac_all_ports = self.session.walk(self.snmp_oid_mac_port)
-
-        for var in mac_all_ports:
-            port_number = int(var.value)
-            mac_address_oid = var.oid.split('.')[-6:]
-            mac_address_list = [int(x) for x in mac_address_oid]
-            mac_address_str = ':'.join(['{:02X}'.format(x) for x in mac_address_list])
-            if port_number not in port_mac_dict:
-                port_mac_dict[port_number] = []
-
-            port_mac_dict[port_number].append(mac_address_str)
-
-        return port_mac_dict
+        return self.snapshot.fdb
 
     def search_uplink(self):
-        uplink_port_data = {}
-        mac_ports = self.get_mac_ports()
-
-        for port, mac_list in mac_ports.items():
-            if any(core_mac in mac_list for core_mac in self.core_mac_address):
-                uplink_port_data[port] = self.get_description_ports(port)
-                return uplink_port_data
-
-        return None
+        port = find_uplink_port(self.ip, self.snapshot, self.core_mac_address)
+        if port is None:
+            return None
+        return {port: self.get_description_ports(port)}
     
     def get_switches(self):
         port_descriptions = self.get_description_ports("All")
@@ -577,18 +459,37 @@ class Zyxel :
 
         return active_user_count
     
-def traverse_switch_hierarchy(current_ip, active_users=0):
+SWITCH_DRIVER_PROFILES = [
+    DriverProfile("dlink", "D-Link", Dlink, descr_any=("D-Link", "DES", "DGS")),
+    DriverProfile("edge_core", "Edge-Core", Edge_Core, descr_any=("ECS", "Edge")),
+    DriverProfile("bdcom_gpon", "BDCOM", BDCOM, descr_all=("BDCOM", "GP3600"), args=("GPON",)),
+    DriverProfile("bdcom_epon", "BDCOM", BDCOM, descr_all=("BDCOM",), descr_none=("GP3600", "3310B"), args=("EPON",)),
+    DriverProfile("bdcom_3310b", "BDCOM", BDCOM, descr_all=("BDCOM", "3310B"), args=("3310B",)),
+    DriverProfile("zyxel", "Zyxel", Zyxel, descr_any=("MGS",)),
+]
+
+
+def create_switch(ip):
     switch_factory = SwitchFactory()
-    switch_object = switch_factory.create_switch(current_ip, core_mac_dict, zabbix_url, zabbix_user, zabbix_password)
-    if switch_object is not None:
-        active_user_count = switch_object.count_active_user()
-        active_users += active_user_count
+    return switch_factory.create_switch(ip, core_macs, zabbix_url, zabbix_user, zabbix_password)
+
+
+UNREACHABLE_ERRORS = (EasySNMPTimeoutError, TimeoutError)
+
+
+async def traverse_switch_hierarchy(current_ip, memo=None):
+    traversal = TopologyTraversal(create_switch, max_traversal_workers, topology_store, memo, circuit_breaker, UNREACHABLE_ERRORS, driver_registry.forget)
+    active_users, switch_users, skipped = await traversal.traverse(current_ip)
+    print("Активні користувачі по комутаторах:", switch_users)
+    if skipped:
+        print("Пропущено піддерева недоступних комутаторів:", skipped)
+    return active_users, switch_users, skipped
 
-        lower_switch_ips = switch_object.get_switches()
-        for lower_switch_ip in lower_switch_ips:
-            active_users = traverse_switch_hierarchy(lower_switch_ips[lower_switch_ip], active_users)
-        
-    return active_users
+
+def skipped_note(skipped):
+    if not skipped:
+        return ""
+    return f"\n {skipped_message} {', '.join(skipped)}"
 
 config = configparser.ConfigParser()
 config.read('config.ini')
@@ -597,6 +498,10 @@ config.read('config.ini')
 community_string = config.get('Snmp', 'community_string')
 version = config.getint('Snmp', 'version')
 core_mac_dict = eval(config.get('Hardware', 'core_mac_dict'))
+core_macs = parse_core_macs(core_mac_dict)
+management_vlans = [int(vlan) for vlan in config.get('Hardware', 'management_vlans', fallback='').split(',') if vlan.strip()]
+uplink_cache_ttl = config.getint('Hardware', 'uplink_cache_ttl', fallback=3600)
+onu_refresh_interval = config.getint('Hardware', 'onu_refresh_interval', fallback=30)
 zabbix_url = config.get('Zabbix', 'zabbix_url')
 zabbix_user = config.get('Zabbix', 'zabbix_user')
 zabbix_password = config.get('Zabbix', 'zabbix_password')
@@ -606,42 +511,121 @@ exceptions_str = config.get('Exceptions', 'exceptions')
 exceptions = [tuple(exception.strip().split(':')) for exception in exceptions_str.split(',')]
 time_sleep = config.get('General', 'time_sleep')
 max_retries = config.get('General', 'max_retries')
+max_traversal_workers = config.getint('General', 'max_traversal_workers', fallback=8)
+max_snmp_workers = config.getint('Snmp', 'max_snmp_workers', fallback=16)
+snmp_min_timeout = config.getfloat('Snmp', 'min_timeout', fallback=0.5)
+snmp_max_timeout = config.getfloat('Snmp', 'max_timeout', fallback=30.0)
+snmp_initial_timeout = config.getfloat('Snmp', 'initial_timeout', fallback=2.0)
+snmp_session_retries = config.getint('Snmp', 'session_retries', fallback=1)
+snmp_retry_base_delay = config.getfloat('Snmp', 'retry_base_delay', fallback=0.5)
+snmp_retry_max_delay = config.getfloat('Snmp', 'retry_max_delay', fallback=10.0)
+session_pool_max_idle = config.getint('Snmp', 'session_pool_max_idle', fallback=256)
+session_pool_idle_timeout = config.getint('Snmp', 'session_pool_idle_timeout', fallback=300)
+breaker_failures = config.getint('Snmp', 'breaker_failures', fallback=2)
+breaker_cooldown = config.getint('Snmp', 'breaker_cooldown', fallback=60)
+breaker_max_cooldown = config.getint('Snmp', 'breaker_max_cooldown', fallback=900)
 no_power_message = config.get('TemplatesTD', 'no_power_message')
 act_users_message = config.get('TemplatesTD', 'act_users_message')
 no_onu_deregistered_message = config.get('TemplatesTD', 'no_onu_deregistered_message')
+skipped_message = config.get('TemplatesTD', 'skipped_message', fallback='Недоступні комутатори, їхніх абонентів не враховано:')
 domains = config.get('Domains', 'domains')
-
-async def process_trigger(trigger, zabbix_url, zabbix_user, zabbix_password, exceptions, core_mac_dict, community_string, version, model_oid):
+host_ip_ttl = config.getint('Zabbix', 'host_ip_ttl', fallback=3600)
+preload_host_inventory = config.getboolean('Zabbix', 'preload_host_inventory', fallback=False)
+full_poll_every = config.getint('Zabbix', 'full_poll_every', fallback=10)
+topology_path = config.get('Topology', 'path', fallback='topology.json')
+topology_max_age = config.getint('Topology', 'max_age', fallback=3600)
+topology_refresh_interval = config.getint('Topology', 'refresh_interval', fallback=600)
+vendor_cache_path = config.get('Snmp', 'vendor_cache_path', fallback='vendor_cache.json')
+vendor_cache_ttl = config.getint('Snmp', 'vendor_cache_ttl', fallback=86400)
+vendor_cache_negative_ttl = config.getint('Snmp', 'vendor_cache_negative_ttl', fallback=600)
+webhook_enabled = config.getboolean('Webhook', 'enabled', fallback=False)
+webhook_host = config.get('Webhook', 'host', fallback='127.0.0.1')
+webhook_port = config.getint('Webhook', 'port', fallback=8080)
+webhook_path = config.get('Webhook', 'path', fallback='/zabbix')
+scheduler_workers = config.getint('Scheduler', 'max_workers', fallback=16)
+scheduler_age_weight = config.getfloat('Scheduler', 'age_weight', fallback=1 / 60)
+scheduler_fair_every = config.getint('Scheduler', 'fair_every', fallback=4)
+scheduler_device_weights = {
+    'olt': config.getfloat('Scheduler', 'olt_weight', fallback=4.0),
+    'gw': config.getfloat('Scheduler', 'gw_weight', fallback=2.0),
+    'sw': config.getfloat('Scheduler', 'sw_weight', fallback=1.0),
+}
+worker_processes = config.getint('Workers', 'processes', fallback=0)
+worker_concurrency = config.getint('Workers', 'concurrency', fallback=4)
+worker_poll_interval = config.getfloat('Workers', 'poll_interval', fallback=0.5)
+worker_job_timeout = config.getint('Workers', 'job_timeout', fallback=900)
+jobs_path = config.get('Workers', 'jobs_path', fallback='jobs.db')
+metrics_textfile = config.get('Metrics', 'textfile', fallback='')
+metrics_host = config.get('Metrics', 'host', fallback='127.0.0.1')
+metrics_port = config.getint('Metrics', 'port', fallback=0)
+profiler_enabled = config.getboolean('Metrics', 'profiler_enabled', fallback=False)
+profiler_interval = config.getfloat('Metrics', 'profiler_interval', fallback=0.01)
+profiler_output = config.get('Metrics', 'profiler_output', fallback='profile.txt')
+
+configure_snmp_executor(max_snmp_workers)
+configure_uplink_lookup(management_vlans, uplink_cache_ttl)
+configure_session_pool(Session, session_pool_max_idle, session_pool_idle_timeout)
+configure_circuit_breaker(breaker_failures, breaker_cooldown, breaker_max_cooldown)
+configure_snmp_timeouts(snmp_min_timeout, snmp_max_timeout, snmp_initial_timeout, snmp_session_retries, snmp_retry_base_delay, snmp_retry_max_delay)
+topology_store = TopologyStore(topology_path, topology_max_age)
+trigger_scheduler = TriggerScheduler(topology_store, scheduler_workers, scheduler_device_weights, scheduler_age_weight, scheduler_fair_every)
+driver_registry = DriverRegistry(vendor_cache_path, vendor_cache_ttl, vendor_cache_negative_ttl)
+for profile in SWITCH_DRIVER_PROFILES:
+    driver_registry.register(profile)
+
+
+def check_onu_power(ip, community_string, version, core_mac_dict):
+    object = BDCOM_LOC_POW(ip, community_string, version, core_mac_dict, zabbix_url, zabbix_user, zabbix_password)
+    return object.check_power_issues(max_age=onu_refresh_interval)
+
+
+async def process_trigger(trigger, zabbix_url, zabbix_user, zabbix_password, exceptions, core_mac_dict, community_string, version, model_oid, memo=None):
     start_time = datetime.datetime.now()
     host_name = trigger['host_name']
     description = trigger['description']
     last_change_datetime = trigger['last_change_datetime']
 
     if "knock-gw-" not in host_name and "sr-te" not in host_name:
-        switch_ip = get_switch_ip(zabbix_url, zabbix_user, zabbix_password, [transform_host_name(host_name, exceptions)])
-        ip = switch_ip[transform_host_name(host_name, exceptions)]
+        ip = trigger.get('ip')
+        if ip is None:
+            switch_ip = await asyncio.to_thread(get_switch_ip, zabbix_url, zabbix_user, zabbix_password, [transform_host_name(host_name, exceptions)])
+            ip = switch_ip[transform_host_name(host_name, exceptions)]
         print(ip)
 
         for retry in range(int(max_retries)):
             try:
-                session = Session(hostname=ip, community=community_string, version=version, use_enums=True, timeout=1)
-                model_value = session.get(model_oid).value
-
-                if "BDCOM" in model_value or "BDCOM(tm)" in model_value:
-                    object = BDCOM_LOC_POW(ip, community_string, version, core_mac_dict, zabbix_url, zabbix_user, zabbix_password)
-                    if object.check_power_issues(object.get_onu_dereg_time()):
-                        act_users = traverse_switch_hierarchy(ip)
-                        add_TD(last_change_datetime, get_region(zabbix_user, zabbix_password, host_name), host_name,  f"{no_power_message} \n {act_users} {act_users_message} \n")
+                profile = await run_snmp(driver_registry.detect, ip, partial(probe_device, community_string=community_string, version=version))
+
+                if profile is not None and profile.vendor == "BDCOM":
+                    if await run_snmp(check_onu_power, ip, community_string, version, core_mac_dict):
+                        act_users, switch_users, skipped = await traverse_switch_hierarchy(ip, memo)
+                        region = trigger.get('region') or await asyncio.to_thread(get_region, zabbix_user, zabbix_password, host_name)
+                        add_TD(last_change_datetime, region, host_name,  f"{no_power_message} \n {act_users} {act_users_message} \n{skipped_note(skipped)}")
                     else:
-                        act_users = traverse_switch_hierarchy(ip)
-                        add_TD(last_change_datetime, get_region(zabbix_user, zabbix_password, host_name), host_name,  f"{no_power_message} \n {act_users} {act_users_message} \n {no_onu_deregistered_message}")
+                        act_users, switch_users, skipped = await traverse_switch_hierarchy(ip, memo)
+                        region = trigger.get('region') or await asyncio.to_thread(get_region, zabbix_user, zabbix_password, host_name)
+                        add_TD(last_change_datetime, region, host_name,  f"{no_power_message} \n {act_users} {act_users_message} \n {no_onu_deregistered_message}{skipped_note(skipped)}")
                 else:
-                    act_users = traverse_switch_hierarchy(ip)
-                    add_TD(last_change_datetime, get_region(zabbix_user, zabbix_password, host_name), host_name,  f"{no_power_message} \n {act_users} {act_users_message} \n")
+                    act_users, switch_users, skipped = await traverse_switch_hierarchy(ip, memo)
+                    region = trigger.get('region') or await asyncio.to_thread(get_region, zabbix_user, zabbix_password, host_name)
+                    add_TD(last_change_datetime, region, host_name,  f"{no_power_message} \n {act_users} {act_users_message} \n{skipped_note(skipped)}")
                 break
             except EasySNMPTimeoutError:
+                # Сюди доходять лише таймаути визначення типу та check_onu_power; таймаути обходу приходять як DeviceUnreachable
                 print(f"Таймаут {ip}. Спроба {retry+1}/{max_retries}")
-                time.sleep(1)
+                device_timeouts.record_timeout(ip)
+                circuit_breaker.record_failure(ip)
+                metrics.inc('snmp_timeouts_total', device=ip)
+                if circuit_breaker.state(ip) == "open":
+                    print(f"{ip} недоступний, повтори припинено до кінця паузи запобіжника")
+                    break
+                metrics.inc('trigger_retries_total')
+                # Чекаємо без блокування циклу: інші тригери обробляються далі
+                await asyncio.sleep(device_timeouts.retry_delay(retry))
+            except DeviceUnreachable as e:
+                # Запобіжник уже врахував таймаут; не чекаємо на мертвий пристрій повторно
+                print(e)
+                break
             except EasySNMPError as e:
                 print(f"Error EasySNMP - {ip}: {e}")
                 break
@@ -651,6 +635,7 @@ async def process_trigger(trigger, zabbix_url, zabbix_user, zabbix_password, exc
     end_time = datetime.datetime.now()  
     execution_time = end_time - start_time  
     print("Час виконання:", execution_time)
+    metrics.observe('trigger_seconds', execution_time.total_seconds())
 
     return host_name, last_change_datetime
 
@@ -659,21 +644,203 @@ async def close_trigger(solution_time, region, host):
     close_TD(solution_time, region, host)
 
 
+def is_tracked_trigger(trigger):
+    host_name = trigger['host_name']
+    if "olt-cn" in host_name or not (host_name.endswith('.te.clb') or host_name.endswith('.te.clb_2')):
+        return False
+    return any(filter_description in trigger['description'] for filter_description in filter_descriptions)
+
+
+async def process_pushed_triggers(queue):
+    # Події з webhook обробляються одразу; опитування лишається для звірки
+    zabbix_api = get_zabbix_api(zabbix_user, zabbix_password)
+    pushed_tasks = set()
+    while True:
+        kind, trigger = await queue.get()
+        if not is_tracked_trigger(trigger):
+            continue
+
+        if kind == 'problem':
+            if not await asyncio.to_thread(zabbix_api.open_pushed_trigger, trigger):
+                continue
+            task = asyncio.create_task(dispatch_triggers([trigger]))
+            pushed_tasks.add(task)
+            task.add_done_callback(pushed_tasks.discard)
+        else:
+            record = await asyncio.to_thread(zabbix_api.close_pushed_trigger, trigger)
+            if record is not None:
+                await close_trigger(trigger['last_change_datetime'], record['region'], record['host_name'])
+
+
+async def resolve_trigger_ips(triggers):
+    # IP усіх хостів одним запитом до Zabbix; обробникам передаються вже готові адреси
+    switch_names = {trigger['trigger_id']: transform_host_name(trigger['host_name'], exceptions)
+                    for trigger in triggers if 'ip' not in trigger and "knock-gw-" not in trigger['host_name'] and "sr-te" not in trigger['host_name']}
+    if not switch_names:
+        return
+    switch_ips = await asyncio.to_thread(get_switch_ip, zabbix_url, zabbix_user, zabbix_password, list(set(switch_names.values())))
+    for trigger in triggers:
+        if trigger['trigger_id'] in switch_names:
+            trigger['ip'] = switch_ips.get(switch_names[trigger['trigger_id']])
+
+
+_job_queue = None
+_worker_processes = {}
+
+
+def get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(jobs_path)
+    return _job_queue
+
+
+def start_worker(index):
+    process = multiprocessing.get_context('spawn').Process(target=run_worker, args=(index,), name=f"trigger-worker-{index}", daemon=True)
+    process.start()
+    _worker_processes[index] = process
+
+
+def restart_dead_workers():
+    for index, process in list(_worker_processes.items()):
+        if not process.is_alive():
+            requeued = get_job_queue().requeue_worker(f"worker-{index}-{process.pid}")
+            print(f"Обробник {index} завершився (код {process.exitcode}), повернуто задач: {requeued}")
+            start_worker(index)
+
+
+async def dispatch_triggers(triggers):
+    # Без процесів-обробників тригери обробляються в цьому процесі, як і раніше
+    await resolve_trigger_ips(triggers)
+    if worker_processes <= 0:
+        # Найбільші аварії обробляються першими, не більше scheduler_workers одночасно
+        memo = TraversalMemo()
+        try:
+            return await trigger_scheduler.run(triggers, lambda trigger: process_trigger(trigger, zabbix_url, zabbix_user, zabbix_password, exceptions, core_mac_dict, community_string, version, model_oid, memo))
+        finally:
+            await asyncio.to_thread(driver_registry.save_if_dirty)
+
+    job_queue = get_job_queue()
+    priorities = [trigger_scheduler.priority(trigger) for trigger in triggers]
+    job_ids = await asyncio.to_thread(job_queue.put_many, str(time.time()), [encode_trigger(trigger) for trigger in triggers], priorities)
+    pending = set(job_ids)
+    completed = []
+    while pending:
+        await asyncio.sleep(worker_poll_interval)
+        restart_dead_workers()
+        await asyncio.to_thread(job_queue.fail_expired, pending, worker_job_timeout)
+        for job_id, status, result in await asyncio.to_thread(job_queue.collect, pending):
+            pending.discard(job_id)
+            if status == FAILED:
+                print(f"Задача {job_id} завершилась помилкою: {result['error']}")
+            else:
+                completed.append((result['host_name'], datetime.datetime.fromisoformat(result['last_change_datetime'])))
+    await asyncio.to_thread(job_queue.purge_finished, worker_job_timeout)
+    return completed
+
+
+def run_worker(index):
+    asyncio.run(worker_loop(index))
+
+
+async def worker_loop(index):
+    # Процес-обробник: забирає тригери з черги і записує результат для координатора.
+    # Топологія та кеш вендорів спільні через файли, IP хостів приходять у задачі
+    job_queue = JobQueue(jobs_path)
+    name = worker_name(index)
+    memos = {}
+    claims = 0
+
+    async def consume():
+        nonlocal claims
+        while True:
+            claims += 1
+            oldest = scheduler_fair_every > 0 and claims % scheduler_fair_every == 0
+            job = await asyncio.to_thread(job_queue.claim, name, scheduler_age_weight, oldest)
+            if job is None:
+                # Черга порожня - цикл опитування завершено, зберігаємо нові визначення вендорів
+                await asyncio.to_thread(driver_registry.save_if_dirty)
+                await asyncio.sleep(worker_poll_interval)
+                continue
+            job_id, batch, payload = job
+            if batch not in memos:
+                # Спільні результати обходу живуть у межах одного циклу опитування
+                await asyncio.to_thread(driver_registry.save_if_dirty)
+                memos.clear()
+                memos[batch] = TraversalMemo()
+            try:
+                host_name, last_change_datetime = await process_trigger(decode_trigger(payload), zabbix_url, zabbix_user, zabbix_password, exceptions, core_mac_dict, community_string, version, model_oid, memos[batch])
+                result, failed = {'host_name': host_name, 'last_change_datetime': last_change_datetime.isoformat()}, False
+            except Exception as e:
+                result, failed = {'error': repr(e)}, True
+            await asyncio.to_thread(job_queue.finish, job_id, result, failed)
+
+    await asyncio.gather(*(consume() for _ in range(worker_concurrency)))
+
+
+async def refresh_topology():
+    traversal = TopologyTraversal(create_switch, max_traversal_workers, topology_store, breaker=circuit_breaker, unreachable_errors=UNREACHABLE_ERRORS, on_driver_error=driver_registry.forget)
+    while True:
+        await asyncio.sleep(topology_refresh_interval)
+        refreshed = await traversal.refresh_stale()
+        await asyncio.to_thread(driver_registry.save_if_dirty)
+        print("Оновлено вузлів топології:", refreshed)
+
+
 async def main():
+    switch_ip_resolver = get_switch_ip_resolver(zabbix_url, zabbix_user, zabbix_password)
+    switch_ip_resolver.ttl = host_ip_ttl
+    get_zabbix_api(zabbix_user, zabbix_password).full_poll_every = full_poll_every
+    if preload_host_inventory:
+        hosts_count = await asyncio.to_thread(switch_ip_resolver.preload)
+        print("Завантажено IP-адрес хостів:", hosts_count)
+
+    if topology_refresh_interval > 0:
+        topology_refresh_task = asyncio.create_task(refresh_topology())
+
+    if webhook_enabled:
+        pushed_queue = asyncio.Queue()
+        webhook_receiver = WebhookReceiver(pushed_queue, webhook_host, webhook_port, webhook_path)
+        await webhook_receiver.start()
+        pushed_triggers_task = asyncio.create_task(process_pushed_triggers(pushed_queue))
+
+    if metrics_port > 0:
+        metrics_server = await serve_metrics(metrics_host, metrics_port)
+
+    if profiler_enabled:
+        profiler = SamplingProfiler(profiler_interval, profiler_output)
+        profiler.start()
+
+    if worker_processes > 0:
+        # Задачі, що виконувались до перезапуску, повертаються в чергу
+        get_job_queue().requeue_orphaned([])
+        for index in range(worker_processes):
+            start_worker(index)
+
+    try:
+        await poll_triggers()
+    finally:
+        if profiler_enabled:
+            profiler.stop()
+
+
+async def poll_triggers():
     while True:
-        triggers = get_zabbix_triggers(zabbix_user, zabbix_password, filter_descriptions, domains)
+        triggers = await asyncio.to_thread(get_zabbix_triggers, zabbix_user, zabbix_password, filter_descriptions, domains)
         #triggers = [{'new_triggers': [{'trigger_id': '485964', 'description': 'No main power -', 'host_name': 'knock-olt-zr-ce.te.clb', 'region': 'TE', 'last_change_datetime': datetime.datetime(2024, 2, 20, 4, 34, 40)}, {'trigger_id': '485544', 'description': 'No main power -', 'host_name': 'sw-zr-no-1.te.clb', 'region': 'TE', 'last_change_datetime': datetime.datetime(2024, 2, 20, 4, 34, 40)}], 'resolved_triggers': []}]
         print(triggers)
 
         if triggers:
-            new_triggers = triggers[0]['new_triggers']
-            resolved_triggers = triggers[0]['resolved_triggers']
+            new_triggers = [trigger for trigger_info in triggers for trigger in trigger_info['new_triggers']]
+            resolved_triggers = [trigger for trigger_info in triggers for trigger in trigger_info['resolved_triggers']]
 
-            tasks = [process_trigger(trigger, zabbix_url, zabbix_user, zabbix_password, exceptions, core_mac_dict, community_string, version, model_oid) for trigger in new_triggers]
-            completed_tasks = await asyncio.gather(*tasks)
+            completed_tasks = await dispatch_triggers(new_triggers)
 
             for trigger in resolved_triggers:
-                await close_trigger(trigger['last_change_datetime'], get_region(zabbix_user, zabbix_password, trigger['host_name']), trigger['host_name'])
+                await close_trigger(trigger['last_change_datetime'], trigger['region'], trigger['host_name'])
+
+        if metrics_textfile:
+            metrics.write_textfile(metrics_textfile)
 
         await asyncio.sleep(int(time_sleep))
 
@@ -0,0 +1,157 @@
+from collections import Counter
+from contextlib import contextmanager
+import asyncio
+import os
+import sys
+import threading
+import time
+
+OID_FAMILIES = [
+    ("1.3.6.1.2.1.1.", "system"),
+    ("1.3.6.1.2.1.2.2.1.8", "ifOperStatus"),
+    ("1.3.6.1.2.1.31.1.1.1.18", "ifAlias"),
+    ("1.3.6.1.2.1.31.1.1.1.1", "ifName"),
+    ("1.3.6.1.2.1.17.7.1.2.2.1.2", "dot1qTpFdbPort"),
+    ("1.3.6.1.4.1.3320.101.11", "bdcomOnuDeregTime"),
+    ("1.3.6.1.4.1.3320.101", "bdcomEpon"),
+    ("1.3.6.1.4.1.3320.10", "bdcomGpon"),
+    ("1.3.6.1.4.1.3320", "bdcom"),
+]
+
+
+def oid_family(oid):
+    oid = oid.lstrip('.')
+    for prefix, family in OID_FAMILIES:
+        if oid.startswith(prefix):
+            return family
+    return "other"
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            count, total, maximum = self.timings.get(key, (0, 0.0, 0.0))
+            self.timings[key] = (count + 1, total + seconds, max(maximum, seconds))
+
+    @contextmanager
+    def span(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        # Формат Prometheus text exposition
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for (name, labels), (count, total, maximum) in timings:
+            if name not in declared:
+                lines.append(f"# TYPE {name} summary")
+                declared.add(name)
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total:.6f}")
+
+        # Summary не може мати інших рядків, тож максимум - окрема сім'я типу gauge
+        for (name, labels), (count, total, maximum) in timings:
+            if name + "_max" not in declared:
+                lines.append(f"# TYPE {name}_max gauge")
+                declared.add(name + "_max")
+            lines.append(f"{name}_max{format_labels(labels)} {maximum:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{key}="{escape_label(value)}"' for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+
+
+async def serve_metrics(host, port):
+    async def handle(reader, writer):
+        try:
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            body = metrics.render().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Метрики: http://{host}:{port}/metrics")
+    return server
+
+
+class SamplingProfiler:
+    # Вмикається з конфігурації: періодично знімає стеки всіх потоків і рахує їх
+    def __init__(self, interval=0.01, output_path="profile.txt"):
+        self.interval = interval
+        self.output_path = output_path
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.dump()
+
+    def dump(self):
+        # Формат "collapsed stacks" для flamegraph.pl / speedscope
+        with open(self.output_path, "w") as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
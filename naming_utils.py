@@ -0,0 +1,34 @@
+# Розбір імен вузлів і описів портів без зовнішніх залежностей
+BDCOM_UPLINK_MARKERS = ("sw-", "gw-", "olt-")
+SWITCH_UPLINK_MARKERS = ("sw-", "gw-", "sr-te")
+
+
+def classify_port_description(description, uplink_markers):
+    if "client" in description or "tr_" in description:
+        return "client"
+    elif any(marker in description for marker in uplink_markers):
+        return description
+    else:
+        return None
+
+
+def transform_host_name(host_name, exceptions):
+    for exception in exceptions:
+        if host_name == exception[0]:
+            return exception[1]
+    parts = host_name.split('.')
+    if len(parts) == 3 and parts[-1] == 'clb':
+        if 'knock-' in parts[0] and 'olt' in parts[0] and '-1' in parts[0]:
+            new_host_name = parts[0].replace('knock-', '') + '.te.clb'
+        else:
+            prefix = parts[0].replace('knock-', '')
+            if 'knock-' in parts[0]:
+                if prefix.startswith('-'):
+                    new_host_name = prefix + '1.te.clb'
+                else:
+                    new_host_name = prefix + '-1.te.clb'
+            else:
+                new_host_name = host_name
+        return new_host_name
+    else:
+        return host_name
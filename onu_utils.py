@@ -0,0 +1,53 @@
+from collections import Counter
+import threading
+import time
+
+
+class OnuDeregTracker:
+    # Останні відомі часи дереєстрації ONU одного OLT і зміни між читаннями
+    def __init__(self, retention=3600):
+        self.retention = retention
+        self.dereg_times = {}
+        self.events = {}
+        self.updated = None
+        self.lock = threading.Lock()
+
+    def update(self, dereg_times, now):
+        # Повертає кількість ONU, час дереєстрації яких змінився
+        changed = 0
+        with self.lock:
+            for mac_address, dereg_epoch in dereg_times.items():
+                if self.dereg_times.get(mac_address) != dereg_epoch:
+                    self.dereg_times[mac_address] = dereg_epoch
+                    if dereg_epoch:
+                        self.events[mac_address] = dereg_epoch
+                        changed += 1
+            oldest = now - self.retention
+            self.events = {mac_address: dereg_epoch for mac_address, dereg_epoch in self.events.items() if dereg_epoch >= oldest}
+            self.updated = time.monotonic()
+        return changed
+
+    def is_stale(self, max_age):
+        return self.updated is None or time.monotonic() - self.updated > max_age
+
+    def recent_deregistrations(self, now, window=600):
+        # Кількість дереєстрацій по хвилинах у ковзному вікні
+        window_start = now - window
+        with self.lock:
+            return Counter(dereg_epoch // 60 for dereg_epoch in self.events.values() if dereg_epoch >= window_start)
+
+    def has_mass_deregistration(self, now, window=600, threshold=2):
+        return any(count >= threshold for count in self.recent_deregistrations(now, window).values())
+
+
+_onu_trackers = {}
+_onu_trackers_lock = threading.Lock()
+
+
+def get_onu_tracker(ip):
+    with _onu_trackers_lock:
+        tracker = _onu_trackers.get(ip)
+        if tracker is None:
+            tracker = OnuDeregTracker()
+            _onu_trackers[ip] = tracker
+        return tracker
@@ -0,0 +1,145 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from state_utils import immediate_transaction
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def encode_trigger(trigger):
+    return json.dumps({key: value.isoformat() if isinstance(value, datetime.datetime) else value for key, value in trigger.items()})
+
+
+def decode_trigger(payload):
+    trigger = json.loads(payload)
+    if trigger.get('last_change_datetime'):
+        trigger['last_change_datetime'] = datetime.datetime.fromisoformat(trigger['last_change_datetime'])
+    return trigger
+
+
+class JobQueue:
+    # Черга задач у SQLite, спільна для координатора і процесів-обробників
+    def __init__(self, path="jobs.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id INTEGER PRIMARY KEY AUTOINCREMENT, batch TEXT, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL, worker TEXT, result TEXT, created REAL, updated REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, job_id)")
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(jobs)")}
+        if 'priority' not in columns:
+            self.connection.execute("ALTER TABLE jobs ADD COLUMN priority REAL NOT NULL DEFAULT 0")
+
+    def transaction(self):
+        return immediate_transaction(self.connection, self.lock)
+
+    def put_many(self, batch, payloads, priorities=None):
+        now = time.time()
+        job_ids = []
+        with self.transaction():
+            for payload, priority in zip(payloads, priorities or [0] * len(payloads)):
+                cursor = self.connection.execute(
+                    "INSERT INTO jobs (batch, payload, status, priority, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                    (batch, payload, QUEUED, priority, now, now)
+                )
+                job_ids.append(cursor.lastrowid)
+        return job_ids
+
+    def claim(self, worker, age_weight=0.0, oldest=False):
+        # Транзакція блокує запис, тож одну задачу забирає лише один процес.
+        # Пріоритет задачі зростає з часом очікування; oldest - забрати найдавнішу
+        order = "job_id" if oldest else "priority + (? - created) * ? DESC, job_id"
+        parameters = (QUEUED,) if oldest else (QUEUED, time.time(), age_weight)
+        with self.transaction():
+            row = self.connection.execute(
+                f"SELECT job_id, batch, payload FROM jobs WHERE status = ? ORDER BY {order} LIMIT 1", parameters
+            ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, updated = ? WHERE job_id = ?",
+                    (RUNNING, worker, time.time(), row[0])
+                )
+        return row
+
+    def finish(self, job_id, result, failed=False):
+        with self.transaction():
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, updated = ? WHERE job_id = ?",
+                (FAILED if failed else DONE, json.dumps(result), time.time(), job_id)
+            )
+
+    def collect(self, job_ids):
+        # Забирає завершені задачі з переданих і видаляє їх із черги
+        job_ids = list(job_ids)
+        if not job_ids:
+            return []
+        placeholders = ",".join("?" * len(job_ids))
+        with self.transaction():
+            rows = self.connection.execute(
+                f"SELECT job_id, status, result FROM jobs WHERE job_id IN ({placeholders}) AND status IN (?, ?)",
+                (*job_ids, DONE, FAILED)
+            ).fetchall()
+            self.connection.executemany("DELETE FROM jobs WHERE job_id = ?", [(row[0],) for row in rows])
+        return [(job_id, status, json.loads(result)) for job_id, status, result in rows]
+
+    def fail_expired(self, job_ids, max_age):
+        # Задачі, що виконуються довше max_age (наприклад, завис запит до Zabbix), завершуються
+        # помилкою, щоб координатор не чекав на них вічно. Пізній finish обробника лише перезапише результат
+        job_ids = list(job_ids)
+        if not job_ids:
+            return 0
+        placeholders = ",".join("?" * len(job_ids))
+        now = time.time()
+        with self.transaction():
+            cursor = self.connection.execute(
+                f"UPDATE jobs SET status = ?, result = ?, updated = ? WHERE job_id IN ({placeholders}) AND status = ? AND updated < ?",
+                (FAILED, json.dumps({'error': f"виконується довше {max_age} с"}), now, *job_ids, RUNNING, now - max_age)
+            )
+        return cursor.rowcount
+
+    def requeue_orphaned(self, live_workers):
+        # Повернути в чергу задачі, чиї процеси-обробники вже не працюють.
+        # Довгі задачі живих обробників не чіпаємо, щоб не виконати їх двічі
+        live_workers = list(live_workers)
+        placeholders = ",".join("?" * len(live_workers))
+        condition = f" AND worker NOT IN ({placeholders})" if live_workers else ""
+        with self.transaction():
+            cursor = self.connection.execute(
+                f"UPDATE jobs SET status = ?, worker = NULL, updated = ? WHERE status = ?{condition}",
+                (QUEUED, time.time(), RUNNING, *live_workers)
+            )
+        return cursor.rowcount
+
+    def requeue_worker(self, worker):
+        with self.transaction():
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, updated = ? WHERE status = ? AND worker = ?",
+                (QUEUED, time.time(), RUNNING, worker)
+            )
+        return cursor.rowcount
+
+    def purge_finished(self, max_age):
+        # Результати задач, які ніхто не забрав (наприклад, після перезапуску координатора)
+        with self.transaction():
+            self.connection.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (DONE, FAILED, time.time() - max_age)
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def worker_name(index):
+    return f"worker-{index}-{os.getpid()}"
@@ -0,0 +1,63 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class DeviceUnreachable(Exception):
+    def __init__(self, ip, reason=""):
+        super().__init__(f"{ip} недоступний{': ' + reason if reason else ''}")
+        self.ip = ip
+
+
+class CircuitBreaker:
+    # Запобіжник для кожної IP: після кількох таймаутів пристрій не опитується до кінця паузи,
+    # потім пропускається одна пробна спроба (half-open), яка або закриває його, або подовжує паузу
+    def __init__(self, failure_threshold=2, cooldown=60, max_cooldown=900):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.devices = {}
+        self.lock = threading.Lock()
+
+    def state(self, ip):
+        with self.lock:
+            device = self.devices.get(ip)
+            return device['state'] if device else CLOSED
+
+    def allow(self, ip):
+        with self.lock:
+            device = self.devices.get(ip)
+            if device is None or device['state'] == CLOSED:
+                return True
+            if device['state'] == OPEN and time.monotonic() >= device['retry_at']:
+                device['state'] = HALF_OPEN
+                return True
+            # Пауза ще триває або пробна спроба вже виконується
+            return False
+
+    def record_success(self, ip):
+        with self.lock:
+            self.devices.pop(ip, None)
+
+    def record_failure(self, ip):
+        with self.lock:
+            device = self.devices.setdefault(ip, {'state': CLOSED, 'failures': 0, 'cooldown': self.cooldown, 'retry_at': 0})
+            device['failures'] += 1
+            if device['state'] == HALF_OPEN:
+                device['cooldown'] = min(device['cooldown'] * 2, self.max_cooldown)
+            elif device['failures'] < self.failure_threshold:
+                return
+            device['state'] = OPEN
+            device['retry_at'] = time.monotonic() + device['cooldown']
+
+
+circuit_breaker = CircuitBreaker()
+
+
+def configure_circuit_breaker(failure_threshold, cooldown, max_cooldown):
+    circuit_breaker.failure_threshold = failure_threshold
+    circuit_breaker.cooldown = cooldown
+    circuit_breaker.max_cooldown = max_cooldown
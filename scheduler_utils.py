@@ -0,0 +1,90 @@
+import asyncio
+import datetime
+
+DEVICE_WEIGHTS = {'olt': 4.0, 'gw': 2.0, 'sw': 1.0}
+
+
+def device_type(host_name):
+    if "olt" in host_name:
+        return 'olt'
+    if "gw-" in host_name:
+        return 'gw'
+    return 'sw'
+
+
+class TriggerScheduler:
+    # Черга тригерів з пріоритетом за оцінкою впливу: кількість абонентів у піддереві з кешу топології,
+    # тип пристрою і вік тригера. Кожен fair_every-й вибір віддається найстарішому тригеру
+    def __init__(self, store=None, max_workers=16, device_weights=None, age_weight=1 / 60, fair_every=4):
+        self.store = store
+        self.max_workers = max_workers
+        self.device_weights = dict(device_weights or DEVICE_WEIGHTS)
+        self.age_weight = age_weight
+        self.fair_every = fair_every
+        self.pending = []
+        self.dispatched = 0
+        self.active = 0
+        self.workers = set()
+
+    def impact(self, trigger):
+        ip = trigger.get('ip')
+        users = self.store.subtree_active_users(ip) if self.store is not None and ip else 0
+        return (1 + users) * self.device_weights.get(device_type(trigger['host_name']), 1.0)
+
+    def age(self, trigger, now=None):
+        last_change_datetime = trigger.get('last_change_datetime')
+        if last_change_datetime is None:
+            return 0.0
+        return max(0.0, ((now or datetime.datetime.now()) - last_change_datetime).total_seconds())
+
+    def priority(self, trigger, impact=None, now=None):
+        impact = self.impact(trigger) if impact is None else impact
+        return impact + self.age_weight * self.age(trigger, now)
+
+    def next_entry(self):
+        self.dispatched += 1
+        now = datetime.datetime.now()
+        if self.fair_every and self.dispatched % self.fair_every == 0:
+            # Дрібні тригери не чекають вічно за великими
+            entry = max(self.pending, key=lambda entry: self.age(entry[0], now))
+        else:
+            entry = max(self.pending, key=lambda entry: self.priority(entry[0], entry[1], now))
+        self.pending.remove(entry)
+        return entry
+
+    def submit(self, trigger, handler):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((trigger, self.impact(trigger), handler, future))
+        while self.active < min(self.max_workers, len(self.pending)):
+            self.active += 1
+            worker = asyncio.create_task(self.work())
+            self.workers.add(worker)
+            worker.add_done_callback(self.workers.discard)
+        return future
+
+    async def work(self):
+        try:
+            while self.pending:
+                trigger, _, handler, future = self.next_entry()
+                try:
+                    result = await handler(trigger)
+                except Exception as e:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+        finally:
+            self.active -= 1
+
+    async def run(self, triggers, handler):
+        # Помилка одного тригера не зупиняє цикл опитування: як і задачі обробників,
+        # такі тригери лише друкуються і не потрапляють у результат
+        results = await asyncio.gather(*(self.submit(trigger, handler) for trigger in triggers), return_exceptions=True)
+        completed = []
+        for trigger, result in zip(triggers, results):
+            if isinstance(result, BaseException):
+                print(f"Тригер {trigger.get('trigger_id')} ({trigger['host_name']}) завершився помилкою: {result!r}")
+            else:
+                completed.append(result)
+        return completed
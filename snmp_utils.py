@@ -0,0 +1,500 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+from array import array
+from functools import partial
+import asyncio
+import datetime
+import random
+import re
+import struct
+import threading
+import time
+import weakref
+from metrics_utils import metrics, oid_family
+
+
+DOT1Q_TP_FDB_PORT = "1.3.6.1.2.1.17.7.1.2.2.1.2"
+MISSING_SNMP_TYPES = ("NOSUCHINSTANCE", "NOSUCHOBJECT", "ENDOFMIBVIEW")
+
+_snmp_executor = None
+_snmp_max_workers = 16
+_management_vlans = ()
+
+
+def configure_snmp_executor(max_workers):
+    global _snmp_max_workers
+    _snmp_max_workers = max_workers
+
+
+def configure_uplink_lookup(management_vlans, cache_ttl):
+    global _management_vlans
+    _management_vlans = tuple(management_vlans)
+    uplink_cache.ttl = cache_ttl
+
+
+def configure_snmp_timeouts(min_timeout, max_timeout, initial_timeout, session_retries, retry_base_delay, retry_max_delay):
+    device_timeouts.min_timeout = min_timeout
+    device_timeouts.max_timeout = max_timeout
+    device_timeouts.initial_timeout = initial_timeout
+    device_timeouts.session_retries = session_retries
+    device_timeouts.retry_base_delay = retry_base_delay
+    device_timeouts.retry_max_delay = retry_max_delay
+
+
+def configure_session_pool(factory, max_idle, idle_timeout):
+    session_pool.factory = factory
+    session_pool.max_idle = max_idle
+    session_pool.idle_timeout = idle_timeout
+
+
+def get_snmp_executor():
+    global _snmp_executor
+    if _snmp_executor is None:
+        _snmp_executor = ThreadPoolExecutor(max_workers=_snmp_max_workers, thread_name_prefix="snmp")
+    return _snmp_executor
+
+
+async def run_snmp(func, *args, **kwargs):
+    # easysnmp блокує потік, тому виконуємо його в окремому пулі
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_snmp_executor(), partial(func, *args, **kwargs))
+
+
+class DeviceTimeouts:
+    # Таймаут SNMP для кожного пристрою за згладженим RTT (як RTO у TCP, RFC 6298)
+    def __init__(self, min_timeout=0.5, max_timeout=30.0, initial_timeout=2.0, session_retries=1,
+                 retry_base_delay=0.5, retry_max_delay=10.0, alpha=0.125, beta=0.25):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.initial_timeout = initial_timeout
+        self.session_retries = session_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.alpha = alpha
+        self.beta = beta
+        self.devices = {}
+        self.lock = threading.Lock()
+
+    def record_rtt(self, ip, rtt):
+        with self.lock:
+            state = self.devices.get(ip)
+            if state is None or state[0] is None:
+                # Перша відповідь (можливо, після таймаутів) задає початкові оцінки
+                self.devices[ip] = [rtt, rtt / 2, 1]
+                return
+            srtt, rttvar, _ = state
+            rttvar = (1 - self.beta) * rttvar + self.beta * abs(srtt - rtt)
+            srtt = (1 - self.alpha) * srtt + self.alpha * rtt
+            self.devices[ip] = [srtt, rttvar, 1]
+
+    def record_timeout(self, ip):
+        # Після таймауту наступна сесія чекає вдвічі довше, доки не прийде відповідь
+        with self.lock:
+            state = self.devices.setdefault(ip, [None, None, 1])
+            state[2] = min(state[2] * 2, 64)
+
+    def timeout(self, ip):
+        with self.lock:
+            srtt, rttvar, backoff = self.devices.get(ip, (None, None, 1))
+        timeout = self.initial_timeout if srtt is None else srtt + 4 * rttvar
+        timeout = max(self.min_timeout, min(timeout, self.max_timeout))
+        return min(timeout * backoff, self.max_timeout)
+
+    def session_options(self, ip):
+        return {'timeout': self.timeout(ip), 'retries': self.session_retries}
+
+    def retry_delay(self, attempt):
+        # Експоненційна затримка з повним джитером, щоб повтори не збігались у часі
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+
+device_timeouts = DeviceTimeouts()
+
+
+class SessionPool:
+    # Сесії SNMP на пристрій перевикористовуються між візитами замість створення нових.
+    # Сесія видається одному власнику і повертається, коли власника знищено
+    def __init__(self, factory=None, max_idle=256, idle_timeout=300):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.idle = {}
+        self.idle_count = 0
+        # Повернення йдуть через deque без блокування: фіналізатор може спрацювати будь-де
+        self.returned = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self, ip, community, version, **options):
+        # Лише числові OID: розбір таблиць порівнює префікси, а назви з MIB (ifName.1) його ламають
+        options = {'use_numeric': True, **options}
+        session_options = device_timeouts.session_options(ip)
+        key = (ip, community, version, session_options['retries'], tuple(sorted(options.items())))
+        with self.lock:
+            self._drain_returned()
+            self._evict(time.monotonic())
+            sessions = self.idle.get(key)
+            while sessions:
+                session, _ = sessions.pop()
+                self.idle_count -= 1
+                if not sessions:
+                    del self.idle[key]
+                # Таймаут задається при створенні сесії; якщо RTT пристрою сильно змінився, створюємо нову
+                if 0.5 <= getattr(session, 'timeout', session_options['timeout']) / session_options['timeout'] <= 2:
+                    metrics.inc('snmp_session_pool_total', result="hit")
+                    return key, session
+        metrics.inc('snmp_session_pool_total', result="miss")
+        session = self.factory(hostname=ip, community=community, version=version, **session_options, **options)
+        return key, session
+
+    def release(self, key, session):
+        self.returned.append((key, session, time.monotonic()))
+
+    def borrow(self, owner, ip, community, version, **options):
+        key, session = self.acquire(ip, community, version, **options)
+        weakref.finalize(owner, self.release, key, session)
+        return session
+
+    @contextmanager
+    def session(self, ip, community, version, **options):
+        key, session = self.acquire(ip, community, version, **options)
+        try:
+            yield session
+        finally:
+            self.release(key, session)
+
+    def _drain_returned(self):
+        while self.returned:
+            key, session, released = self.returned.popleft()
+            self.idle.setdefault(key, []).append((session, released))
+            self.idle_count += 1
+
+    def _evict(self, now):
+        # Прибрати сесії, що простоюють довше idle_timeout, і найстаріші понад max_idle
+        expired = now - self.idle_timeout
+        entries = sorted((released, key) for key, sessions in self.idle.items() for _, released in sessions)
+        excess = max(0, self.idle_count - self.max_idle)
+        for position, (released, key) in enumerate(entries):
+            if released >= expired and position >= excess:
+                break
+            sessions = self.idle[key]
+            sessions.pop(0)
+            self.idle_count -= 1
+            if not sessions:
+                del self.idle[key]
+
+    def clear(self):
+        with self.lock:
+            self.returned.clear()
+            self.idle.clear()
+            self.idle_count = 0
+
+
+session_pool = SessionPool()
+
+
+def normalize_oid(oid):
+    # easysnmp може повертати OID як ".1.3.6..." або "iso.3.6..."
+    oid = oid.lstrip('.')
+    if oid.startswith('iso'):
+        oid = '1' + oid[3:]
+    return oid
+
+
+def mac_to_int(mac):
+    if isinstance(mac, int):
+        return mac
+    return int(re.sub(r'[^0-9A-Fa-f]', '', mac), 16)
+
+
+def mac_from_index(index):
+    # Останні 6 компонентів індексу FDB - це октети MAC-адреси
+    octets = index.rsplit('.', 6)[-6:]
+    return int.from_bytes(bytes(int(octet) for octet in octets), 'big')
+
+
+def int_to_mac(value):
+    return ':'.join('{:02X}'.format(octet) for octet in value.to_bytes(6, 'big'))
+
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+DATE_AND_TIME = struct.Struct('>HBBBBB')
+
+
+def naive_epoch(moment):
+    # Секунди від 1970-01-01 для "наївного" локального часу, без перерахунку часового поясу
+    return (moment.toordinal() - EPOCH_ORDINAL) * 86400 + moment.hour * 3600 + moment.minute * 60 + moment.second
+
+
+def decode_date_and_time(values):
+    # Пакетне декодування SNMP DateAndTime у масив цілих (naive_epoch); 0 - некоректна дата
+    raw = b''.join(value.encode('latin-1')[:DATE_AND_TIME.size].ljust(DATE_AND_TIME.size, b'\0') for value in values)
+    day_bases = {}
+    epochs = array('q')
+    for year, month, day, hour, minute, second in DATE_AND_TIME.iter_unpack(raw):
+        day_key = (year, month, day)
+        day_base = day_bases.get(day_key)
+        if day_base is None:
+            try:
+                day_base = (datetime.date(year, month, day).toordinal() - EPOCH_ORDINAL) * 86400
+            except ValueError:
+                day_base = -1
+            day_bases[day_key] = day_base
+        epochs.append(day_base + hour * 3600 + minute * 60 + second if day_base >= 0 else 0)
+    return epochs
+
+
+def parse_core_macs(core_macs):
+    return frozenset(mac_to_int(mac) for mac in core_macs)
+
+
+def full_oid(var):
+    oid = normalize_oid(var.oid)
+    if var.oid_index:
+        return oid + '.' + var.oid_index
+    return oid
+
+
+class SnmpTableFetcher:
+    def __init__(self, session, max_repetitions=25):
+        self.session = session
+        self.max_repetitions = max_repetitions
+        self.request_count = 0
+        self.device = getattr(session, 'hostname', '')
+
+    def count_request(self, oid):
+        self.request_count += 1
+        metrics.inc('snmp_requests_total', device=self.device, family=oid_family(oid))
+
+    def get(self, oid):
+        self.count_request(oid[0] if isinstance(oid, list) else oid)
+        start = time.perf_counter()
+        result = self.session.get(oid)
+        device_timeouts.record_rtt(self.device, time.perf_counter() - start)
+        return result
+
+    def walk(self, oid):
+        self.count_request(oid)
+        return self.session.walk(oid)
+
+    def get_column(self, base_oid):
+        return self.get_columns([base_oid])[normalize_oid(base_oid).rstrip('.')]
+
+    def get_columns(self, base_oids):
+        # Забрати кілька колонок таблиці одночасно через GETBULK.
+        # Повертає {base_oid: {index: value}}
+        bases = [normalize_oid(oid).rstrip('.') for oid in base_oids]
+        if getattr(self.session, 'version', 2) == 1:
+            # SNMPv1 не має GETBULK: кожна колонка обходиться через GETNEXT
+            return {base: self.walk_column(base) for base in bases}
+        tables = {base: {} for base in bases}
+        cursors = {base: base for base in bases}
+
+        while cursors:
+            active = list(cursors)
+            self.count_request(active[0])
+            start = time.perf_counter()
+            varbinds = self.session.get_bulk([cursors[base] for base in active], 0, self.max_repetitions)
+            device_timeouts.record_rtt(self.device, time.perf_counter() - start)
+
+            if not varbinds:
+                break
+
+            finished = set()
+            previous = dict(cursors)
+            for position, var in enumerate(varbinds):
+                base = active[position % len(active)]
+                if base in finished:
+                    continue
+                oid = full_oid(var)
+                prefix = base + '.'
+                if var.snmp_type == 'ENDOFMIBVIEW' or not oid.startswith(prefix):
+                    finished.add(base)
+                    continue
+                tables[base][oid[len(prefix):]] = var.value
+                cursors[base] = oid
+
+            for base in active:
+                # Колонка закінчилась або агент не просунувся далі
+                if base in finished or cursors[base] == previous[base]:
+                    cursors.pop(base, None)
+
+        return tables
+
+    def walk_column(self, base):
+        prefix = base + '.'
+        column = {}
+        for var in self.walk(base):
+            oid = full_oid(var)
+            if oid.startswith(prefix):
+                column[oid[len(prefix):]] = var.value
+        return column
+
+
+IF_NAME_OID = "1.3.6.1.2.1.31.1.1.1.1"
+IF_OPER_STATUS_OID = "1.3.6.1.2.1.2.2.1.8"
+IF_ALIAS_OID = "1.3.6.1.2.1.31.1.1.1.18"
+
+INDEX_INT = "int"
+INDEX_LAST = "last"
+INDEX_RAW = "raw"
+
+
+class OidProfile:
+    # Опис таблиць пристрою як даних: колонки за ролями, спосіб розбору індексу,
+    # фільтр фізичних портів за ifName і таблиця FDB
+    def __init__(self, name, columns, index=None, port_pattern=None, port_count="len", fdb=DOT1Q_TP_FDB_PORT, max_repetitions=25, max_varbinds=200):
+        self.name = name
+        self.columns = {role: normalize_oid(oid).rstrip('.') for role, oid in columns.items()}
+        self.index = index or {}
+        self.port_pattern = re.compile(port_pattern) if port_pattern else None
+        self.port_count = port_count
+        self.fdb = normalize_oid(fdb).rstrip('.')
+        self.max_repetitions = max_repetitions
+        self.max_varbinds = max_varbinds
+
+    def derive(self, name, columns=None, index=None, **changes):
+        # Новий профіль на основі цього, з доданими або заміненими колонками
+        options = {
+            'port_pattern': self.port_pattern.pattern if self.port_pattern else None,
+            'port_count': self.port_count,
+            'fdb': self.fdb,
+            'max_repetitions': self.max_repetitions,
+            'max_varbinds': self.max_varbinds,
+        }
+        options.update(changes)
+        return OidProfile(name, {**self.columns, **(columns or {})}, {**self.index, **(index or {})}, **options)
+
+    def parse_column(self, role, column):
+        mapping = self.index.get(role, INDEX_INT)
+        if mapping == INDEX_INT:
+            return {int(index): value for index, value in column.items() if index.isdigit()}
+        if mapping == INDEX_LAST:
+            return {int(index.rsplit('.', 1)[-1]): value for index, value in column.items()}
+        return column
+
+    def count_ports(self, if_names):
+        matches = [match for match in map(self.port_pattern.search, if_names) if match]
+        if self.port_count == "max":
+            return max((int(match.group(1)) for match in matches), default=0)
+        return len(matches)
+
+
+def plan_requests(profile, roles):
+    # Колонки, потрібні візиту, об'єднуються в GETBULK-запити по кілька колонок,
+    # щоб кожна відповідь вміщала не більше max_varbinds значень
+    columns_per_pdu = max(1, profile.max_varbinds // profile.max_repetitions)
+    oids = list(dict.fromkeys(profile.columns[role] for role in roles))
+    return [oids[start:start + columns_per_pdu] for start in range(0, len(oids), columns_per_pdu)]
+
+
+class DeviceSnapshot:
+    # Знімок таблиць комутатора, який читається один раз за візит.
+    # Усі колонки профілю забираються разом при першому зверненні; FDB - окремо і лише за потреби
+    def __init__(self, fetcher, profile):
+        self.fetcher = fetcher
+        self.profile = profile
+        self.fdb_oid = profile.fdb
+        self.tables = {}
+        self._fdb = None
+        self._port_count = None
+
+    def prefetch(self, roles=None):
+        roles = [role for role in (roles or self.profile.columns) if role not in self.tables]
+        roles_by_oid = {}
+        for role in roles:
+            roles_by_oid.setdefault(self.profile.columns[role], []).append(role)
+        for oids in plan_requests(self.profile, roles):
+            for oid, column in self.fetcher.get_columns(oids).items():
+                for role in roles_by_oid[oid]:
+                    self.tables[role] = self.profile.parse_column(role, column)
+
+    def column(self, role):
+        if role not in self.tables:
+            self.prefetch()
+        return self.tables[role]
+
+    @property
+    def if_name(self):
+        return self.column('if_name')
+
+    @property
+    def oper_status(self):
+        return self.column('oper_status')
+
+    @property
+    def alias(self):
+        return self.column('alias')
+
+    @property
+    def port_count(self):
+        if self._port_count is None:
+            self._port_count = self.profile.count_ports(self.if_name.values())
+        return self._port_count
+
+    @property
+    def fdb(self):
+        # FDB зберігається компактно: порт -> масив 48-бітних MAC у вигляді цілих
+        if self._fdb is None:
+            fdb = {}
+            for index, value in self.fetcher.get_column(self.fdb_oid).items():
+                port_number = int(value)
+                if port_number not in fdb:
+                    fdb[port_number] = array('Q')
+                fdb[port_number].append(mac_from_index(index))
+            self._fdb = fdb
+        return self._fdb
+
+    def find_port_direct(self, macs, vlans, chunk_size=32):
+        # Точкові GET dot1qTpFdbPort.<vlan>.<mac> замість обходу всієї FDB
+        if self.fdb_oid != DOT1Q_TP_FDB_PORT:
+            return None
+        oids = [
+            self.fdb_oid + '.' + str(vlan) + '.' + '.'.join(str(octet) for octet in mac.to_bytes(6, 'big'))
+            for vlan in vlans for mac in macs
+        ]
+        for start in range(0, len(oids), chunk_size):
+            for var in self.fetcher.get(oids[start:start + chunk_size]):
+                if var.snmp_type not in MISSING_SNMP_TYPES and var.value.isdigit() and int(var.value) > 0:
+                    return int(var.value)
+        return None
+
+    def find_port(self, macs):
+        # Перший порт, на якому видно хоча б одну з MAC-адрес
+        for port_number, port_macs in self.fdb.items():
+            if not macs.isdisjoint(port_macs):
+                return port_number
+        return None
+
+
+class UplinkCache:
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self.ports = {}
+
+    def get(self, ip):
+        entry = self.ports.get(ip)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def set(self, ip, port):
+        self.ports[ip] = (port, time.monotonic() + self.ttl)
+
+
+uplink_cache = UplinkCache()
+
+
+def find_uplink_port(ip, snapshot, core_macs):
+    port = uplink_cache.get(ip)
+    if port is not None:
+        return port
+
+    if _management_vlans:
+        port = snapshot.find_port_direct(core_macs, _management_vlans)
+    if port is None:
+        # Промах: повний обхід FDB
+        port = snapshot.find_port(core_macs)
+    if port is not None:
+        uplink_cache.set(ip, port)
+    return port
@@ -0,0 +1,145 @@
+from contextlib import contextmanager
+import datetime
+import fcntl
+import json
+import sqlite3
+import threading
+import time
+
+
+@contextmanager
+def interprocess_lock(path):
+    # Блокування файлу між процесами-обробниками, що пишуть спільний кеш
+    with open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def immediate_transaction(connection, lock):
+    # З'єднання працюють в autocommit (isolation_level=None), де "with connection" транзакцію
+    # не відкриває; BEGIN IMMEDIATE одразу бере блокування запису між процесами
+    with lock:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+
+def read_json(path, default):
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+LEGACY_MIGRATED = 1
+
+
+class TriggerStateStore:
+    # Відкриті тригери в SQLite (WAL): оновлюються лише зміни, а не весь список
+    def __init__(self, path="previous_triggers.db", legacy_path="previous_triggers.json"):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS triggers ("
+            "trigger_id TEXT PRIMARY KEY, host_name TEXT, region TEXT, description TEXT, "
+            "opened_at INTEGER, pushed INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.migrate_legacy(legacy_path)
+
+    def transaction(self):
+        return immediate_transaction(self.connection, self.lock)
+
+    def migrate_legacy(self, legacy_path):
+        # Перенести ID зі старого previous_triggers.json один раз, позначивши це в user_version:
+        # інакше після закриття всіх тригерів старі ID поверталися б як відкриті при кожному перезапуску.
+        # Хост і регіон таких записів дописує fill_missing під час повного опитування
+        with self.transaction():
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] >= LEGACY_MIGRATED:
+                return
+            if not self.connection.execute("SELECT 1 FROM triggers LIMIT 1").fetchone():
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO triggers (trigger_id) VALUES (?)",
+                    [(str(trigger_id),) for trigger_id in read_json(legacy_path, [])]
+                )
+            self.connection.execute(f"PRAGMA user_version = {LEGACY_MIGRATED}")
+
+    def ids(self):
+        with self.lock:
+            return {row[0] for row in self.connection.execute("SELECT trigger_id FROM triggers")}
+
+    def pushed_ids(self):
+        with self.lock:
+            return {row[0] for row in self.connection.execute("SELECT trigger_id FROM triggers WHERE pushed = 1")}
+
+    def open(self, triggers, pushed=False):
+        rows = [
+            (
+                trigger['trigger_id'],
+                trigger.get('host_name'),
+                trigger.get('region'),
+                trigger.get('description'),
+                int(trigger['last_change_datetime'].timestamp()) if trigger.get('last_change_datetime') else int(time.time()),
+                int(pushed)
+            )
+            for trigger in triggers
+        ]
+        if not rows:
+            return
+        with self.transaction():
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO triggers (trigger_id, host_name, region, description, opened_at, pushed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def close(self, trigger_ids):
+        # Видаляє тригери і повертає збережені про них дані
+        trigger_ids = list(trigger_ids)
+        if not trigger_ids:
+            return []
+        with self.transaction():
+            records = []
+            for trigger_id in trigger_ids:
+                row = self.connection.execute(
+                    "SELECT trigger_id, host_name, region, description, opened_at FROM triggers WHERE trigger_id = ?",
+                    (trigger_id,)
+                ).fetchone()
+                if row is None:
+                    continue
+                self.connection.execute("DELETE FROM triggers WHERE trigger_id = ?", (trigger_id,))
+                records.append({
+                    'trigger_id': row[0],
+                    'host_name': row[1],
+                    'region': row[2],
+                    'description': row[3],
+                    'opened_datetime': datetime.datetime.fromtimestamp(row[4]) if row[4] else None
+                })
+            return records
+
+    def fill_missing(self, triggers):
+        rows = [(trigger.get('host_name'), trigger.get('region'), trigger.get('description'), trigger['trigger_id']) for trigger in triggers]
+        if not rows:
+            return
+        with self.transaction():
+            self.connection.executemany(
+                "UPDATE triggers SET host_name = ?, region = ?, description = ? WHERE trigger_id = ? AND host_name IS NULL",
+                rows
+            )
+
+    def mark_polled(self, trigger_ids):
+        trigger_ids = list(trigger_ids)
+        if not trigger_ids:
+            return
+        with self.transaction():
+            self.connection.executemany("UPDATE triggers SET pushed = 0 WHERE trigger_id = ?", [(trigger_id,) for trigger_id in trigger_ids])
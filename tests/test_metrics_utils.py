@@ -0,0 +1,36 @@
+from metrics_utils import Metrics, oid_family
+
+
+def test_render_exposes_max_as_separate_gauge():
+    metrics = Metrics()
+    metrics.inc('snmp_timeouts_total', device='10.0.0.1')
+    metrics.observe('snmp_request_seconds', 0.5, family='ifAlias')
+    metrics.observe('snmp_request_seconds', 1.5, family='ifAlias')
+    metrics.observe('snmp_request_seconds', 0.25, family='system')
+
+    lines = metrics.render().splitlines()
+    assert lines == [
+        '# TYPE snmp_timeouts_total counter',
+        'snmp_timeouts_total{device="10.0.0.1"} 1',
+        '# TYPE snmp_request_seconds summary',
+        'snmp_request_seconds_count{family="ifAlias"} 2',
+        'snmp_request_seconds_sum{family="ifAlias"} 2.000000',
+        'snmp_request_seconds_count{family="system"} 1',
+        'snmp_request_seconds_sum{family="system"} 0.250000',
+        '# TYPE snmp_request_seconds_max gauge',
+        'snmp_request_seconds_max{family="ifAlias"} 1.500000',
+        'snmp_request_seconds_max{family="system"} 0.250000',
+    ]
+
+
+def test_render_escapes_label_values():
+    metrics = Metrics()
+    metrics.inc('errors_total', reason='bad "quote"\n')
+    assert 'errors_total{reason="bad \\"quote\\"\\n"} 1' in metrics.render()
+
+
+def test_oid_family_matches_most_specific_prefix():
+    assert oid_family('.1.3.6.1.4.1.3320.101.11.1.1.10.5') == 'bdcomOnuDeregTime'
+    assert oid_family('1.3.6.1.4.1.3320.101.10.5') == 'bdcomEpon'
+    assert oid_family('1.3.6.1.2.1.31.1.1.1.18.3') == 'ifAlias'
+    assert oid_family('1.3.6.1.4.1.9.1') == 'other'
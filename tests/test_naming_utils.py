@@ -0,0 +1,20 @@
+from naming_utils import transform_host_name, classify_port_description, BDCOM_UPLINK_MARKERS, SWITCH_UPLINK_MARKERS
+
+
+def test_transform_host_name_prefers_exceptions():
+    assert transform_host_name("knock-sw-a.te.clb", [("knock-sw-a.te.clb", "sw-b.te.clb")]) == "sw-b.te.clb"
+
+
+def test_transform_host_name_rewrites_knock_names():
+    assert transform_host_name("knock-sw-a.te.clb", []) == "sw-a-1.te.clb"
+    assert transform_host_name("knock-olt-a-1.te.clb", []) == "olt-a-1.te.clb"
+    assert transform_host_name("sw-a.te.clb", []) == "sw-a.te.clb"
+    assert transform_host_name("sw-a.example", []) == "sw-a.example"
+
+
+def test_classify_port_description_uses_vendor_markers():
+    assert classify_port_description("client 42", SWITCH_UPLINK_MARKERS) == "client"
+    assert classify_port_description("sr-te-3", SWITCH_UPLINK_MARKERS) == "sr-te-3"
+    assert classify_port_description("sr-te-3", BDCOM_UPLINK_MARKERS) is None
+    assert classify_port_description("olt-7", BDCOM_UPLINK_MARKERS) == "olt-7"
+    assert classify_port_description("", SWITCH_UPLINK_MARKERS) is None
@@ -0,0 +1,68 @@
+import datetime
+
+import pytest
+
+from queue_utils import DONE, FAILED, JobQueue, decode_trigger, encode_trigger
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"))
+
+
+def test_trigger_payload_round_trip():
+    trigger = {'trigger_id': '1', 'host_name': 'sw-zr-no-1.te.clb', 'last_change_datetime': datetime.datetime(2024, 2, 20, 4, 34, 40)}
+    assert decode_trigger(encode_trigger(trigger)) == trigger
+
+
+def test_claim_prefers_priority_and_oldest_on_request(job_queue):
+    job_queue.put_many('batch', ['low', 'high', 'middle'], [1, 50, 5])
+
+    assert job_queue.claim('worker-0')[2] == 'high'
+    assert job_queue.claim('worker-0', oldest=True)[2] == 'low'
+    assert job_queue.claim('worker-0')[2] == 'middle'
+    assert job_queue.claim('worker-0') is None
+
+
+def test_collect_returns_finished_jobs_once(job_queue):
+    first, second = job_queue.put_many('batch', ['a', 'b'])
+    job_queue.claim('worker-0')
+    job_queue.finish(first, {'host_name': 'a'})
+
+    assert job_queue.collect([first, second]) == [(first, DONE, {'host_name': 'a'})]
+    assert job_queue.collect([first, second]) == []
+
+    job_queue.claim('worker-0')
+    job_queue.finish(second, {'error': 'boom'}, failed=True)
+    assert job_queue.collect([second]) == [(second, FAILED, {'error': 'boom'})]
+
+
+def test_requeue_orphaned_keeps_jobs_of_live_workers(job_queue):
+    job_queue.put_many('batch', ['a', 'b'])
+    job_queue.claim('worker-0-100')
+    job_queue.claim('worker-1-200')
+
+    assert job_queue.requeue_orphaned(['worker-0-100']) == 1
+    assert job_queue.claim('worker-1-201')[2] == 'b'
+    assert job_queue.requeue_orphaned([]) == 2
+
+
+def test_fail_expired_fails_only_long_running_jobs(job_queue):
+    stuck, fresh, queued = job_queue.put_many('batch', ['stuck', 'fresh', 'queued'], [3, 2, 1])
+    job_queue.claim('worker-0')
+    job_queue.claim('worker-1')
+    job_queue.connection.execute("UPDATE jobs SET updated = updated - 100 WHERE job_id = ?", (stuck,))
+
+    assert job_queue.fail_expired([stuck, fresh, queued], 60) == 1
+    results = job_queue.collect([stuck, fresh, queued])
+    assert [(job_id, status) for job_id, status, _ in results] == [(stuck, FAILED)]
+    assert '60' in results[0][2]['error']
+
+
+def test_failed_transaction_is_rolled_back(job_queue):
+    with pytest.raises(RuntimeError):
+        with job_queue.transaction() as connection:
+            connection.execute("INSERT INTO jobs (payload, status) VALUES ('a', 'queued')")
+            raise RuntimeError("збій")
+
+    assert job_queue.claim('worker-0') is None
@@ -0,0 +1,92 @@
+import pytest
+
+from reachability_utils import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, DeviceUnreachable
+from metrics_utils import Metrics
+from snmp_utils import DeviceTimeouts
+import topology_utils
+from topology_utils import TopologyTraversal
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0)
+    breaker.record_failure('10.0.0.1')
+    assert breaker.state('10.0.0.1') == CLOSED
+
+    breaker.record_failure('10.0.0.1')
+    assert breaker.state('10.0.0.1') == OPEN
+
+    assert breaker.allow('10.0.0.1')
+    assert breaker.state('10.0.0.1') == HALF_OPEN
+    # Поки пробна спроба не завершилась, інші не пропускаються
+    assert not breaker.allow('10.0.0.1')
+
+    breaker.record_success('10.0.0.1')
+    assert breaker.state('10.0.0.1') == CLOSED
+
+
+def test_failed_half_open_probe_doubles_cooldown():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10, max_cooldown=15)
+    breaker.record_failure('10.0.0.1')
+    breaker.devices['10.0.0.1']['retry_at'] = 0
+    assert breaker.allow('10.0.0.1')
+
+    breaker.record_failure('10.0.0.1')
+
+    assert breaker.state('10.0.0.1') == OPEN
+    assert breaker.devices['10.0.0.1']['cooldown'] == 15
+    assert not breaker.allow('10.0.0.1')
+
+
+def half_open_breaker(ip):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure(ip)
+    return breaker
+
+
+def raise_driver_error(ip):
+    raise ValueError("драйвер не розібрав відповідь")
+
+
+@pytest.mark.parametrize("create_switch", [lambda ip: None, raise_driver_error])
+def test_visit_closes_breaker_when_device_answered(create_switch):
+    breaker = half_open_breaker('10.0.0.1')
+    traversal = TopologyTraversal(create_switch, breaker=breaker)
+
+    try:
+        traversal.visit('10.0.0.1')
+    except ValueError:
+        pass
+
+    assert breaker.state('10.0.0.1') == CLOSED
+    assert breaker.allow('10.0.0.1')
+
+
+def test_visit_reopens_breaker_on_timeout():
+    def timeout(ip):
+        raise TimeoutError("timed out")
+
+    breaker = half_open_breaker('10.0.0.1')
+    traversal = TopologyTraversal(timeout, breaker=breaker)
+
+    with pytest.raises(DeviceUnreachable):
+        traversal.visit('10.0.0.1')
+    assert breaker.state('10.0.0.1') == OPEN
+
+    breaker.devices['10.0.0.1']['retry_at'] = 0
+    with pytest.raises(DeviceUnreachable):
+        traversal.visit('10.0.0.1')
+    assert breaker.state('10.0.0.1') == OPEN
+
+
+def test_visit_records_each_timeout_once(monkeypatch):
+    timeouts, metrics = DeviceTimeouts(initial_timeout=2.0, max_timeout=30.0), Metrics()
+    monkeypatch.setattr(topology_utils, 'device_timeouts', timeouts)
+    monkeypatch.setattr(topology_utils, 'metrics', metrics)
+
+    def timeout(ip):
+        raise TimeoutError("timed out")
+
+    with pytest.raises(DeviceUnreachable):
+        TopologyTraversal(timeout).visit('10.0.0.1')
+    assert timeouts.timeout('10.0.0.1') == 4.0
+    assert metrics.counters[('snmp_timeouts_total', (('device', '10.0.0.1'),))] == 1
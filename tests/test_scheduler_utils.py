@@ -0,0 +1,88 @@
+import asyncio
+import datetime
+
+from scheduler_utils import TriggerScheduler, device_type
+
+
+class Store:
+    def __init__(self, users):
+        self.users = users
+
+    def subtree_active_users(self, ip):
+        return self.users.get(ip, 0)
+
+
+def make_trigger(host_name, minutes_ago=0, ip=None):
+    return {
+        'host_name': host_name,
+        'ip': ip,
+        'last_change_datetime': datetime.datetime.now() - datetime.timedelta(minutes=minutes_ago),
+    }
+
+
+def run_order(scheduler, triggers):
+    order = []
+
+    async def handler(trigger):
+        order.append(trigger['host_name'])
+        return trigger['host_name']
+
+    results = asyncio.run(scheduler.run(triggers, handler))
+    return order, results
+
+
+def test_device_type():
+    assert device_type('knock-olt-zr-ce.te.clb') == 'olt'
+    assert device_type('knock-gw-zr.te.clb') == 'gw'
+    assert device_type('sw-zr-no-1.te.clb') == 'sw'
+
+
+def test_impact_counts_subtree_users_and_device_weight():
+    scheduler = TriggerScheduler(Store({'10.0.0.1': 9}))
+    assert scheduler.impact(make_trigger('sw-a.te.clb', ip='10.0.0.1')) == 10.0
+    assert scheduler.impact(make_trigger('olt-a.te.clb', ip='10.0.0.2')) == 4.0
+    assert scheduler.impact(make_trigger('sw-a.te.clb')) == 1.0
+
+
+def test_run_dispatches_highest_impact_first_and_keeps_result_order():
+    scheduler = TriggerScheduler(Store({'10.0.0.3': 20}), max_workers=1, fair_every=0)
+    triggers = [make_trigger('sw-a.te.clb', ip='10.0.0.1'), make_trigger('olt-b.te.clb', ip='10.0.0.2'), make_trigger('sw-c.te.clb', ip='10.0.0.3')]
+
+    order, results = run_order(scheduler, triggers)
+
+    assert order == ['sw-c.te.clb', 'olt-b.te.clb', 'sw-a.te.clb']
+    assert results == ['sw-a.te.clb', 'olt-b.te.clb', 'sw-c.te.clb']
+
+
+def test_every_fair_pick_goes_to_the_oldest_trigger():
+    scheduler = TriggerScheduler(max_workers=1, age_weight=0, fair_every=2)
+    triggers = [make_trigger('olt-a.te.clb', 1), make_trigger('olt-b.te.clb', 2), make_trigger('sw-old.te.clb', 600)]
+
+    order, _ = run_order(scheduler, triggers)
+
+    assert order[1] == 'sw-old.te.clb'
+
+
+def test_workers_are_bounded_and_failures_stay_per_trigger(capsys):
+    scheduler = TriggerScheduler(max_workers=2)
+    running = 0
+    peak = 0
+
+    async def handler(trigger):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if trigger['host_name'] == 'sw-bad.te.clb':
+            raise KeyError(trigger['host_name'])
+        return trigger['host_name']
+
+    triggers = [make_trigger(f'sw-{index}.te.clb') for index in range(4)]
+    triggers.insert(2, make_trigger('sw-bad.te.clb'))
+    results = asyncio.run(scheduler.run(triggers, handler))
+
+    assert peak == 2
+    assert results == [f'sw-{index}.te.clb' for index in range(4)]
+    assert scheduler.active == 0
+    assert 'sw-bad.te.clb' in capsys.readouterr().out
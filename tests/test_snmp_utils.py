@@ -0,0 +1,188 @@
+import types
+
+import pytest
+
+from snmp_utils import DeviceSnapshot, DeviceTimeouts, OidProfile, SessionPool, SnmpTableFetcher, IF_OPER_STATUS_OID, INDEX_LAST, normalize_oid, plan_requests
+
+IF_NAME = "1.3.6.1.2.1.31.1.1.1.1"
+IF_ALIAS = "1.3.6.1.2.1.31.1.1.1.18"
+
+
+class Var:
+    def __init__(self, oid, value, snmp_type='OCTETSTR'):
+        self.oid = '.' + oid
+        self.oid_index = ''
+        self.value = value
+        self.snmp_type = snmp_type
+
+
+class FakeSession:
+    # Агент з use_numeric=True: GETBULK повертає наступні OID після кожного курсора по черзі
+    def __init__(self, table):
+        self.hostname = '10.0.0.1'
+        self.table = sorted(table.items(), key=lambda item: [int(part) for part in item[0].split('.')])
+        self.version = 2
+        self.bulk_calls = 0
+        self.walks = []
+
+    def next_after(self, oid):
+        key = [int(part) for part in normalize_oid(oid).split('.')]
+        for table_oid, value in self.table:
+            if [int(part) for part in table_oid.split('.')] > key:
+                return Var(table_oid, value)
+        return Var(oid, '', 'ENDOFMIBVIEW')
+
+    def get_bulk(self, oids, non_repeaters, max_repetitions):
+        self.bulk_calls += 1
+        varbinds = []
+        cursors = list(oids)
+        for _ in range(max_repetitions):
+            for position, oid in enumerate(cursors):
+                var = self.next_after(oid)
+                varbinds.append(var)
+                cursors[position] = var.oid
+        return varbinds
+
+    def walk(self, oid):
+        self.walks.append(oid)
+        return [Var(table_oid, value) for table_oid, value in self.table]
+
+
+def make_table():
+    table = {f"{IF_NAME}.{index}": f"1/{index}" for index in range(1, 8)}
+    table.update({f"{IF_ALIAS}.{index}": f"client_{index}" for index in range(1, 4)})
+    table["1.3.6.1.2.1.31.1.1.1.19.1"] = "після таблиці"
+    return table
+
+
+def test_get_columns_ends_each_column_at_its_prefix():
+    session = FakeSession(make_table())
+    columns = SnmpTableFetcher(session, max_repetitions=3).get_columns([IF_NAME, IF_ALIAS])
+
+    assert columns[IF_NAME] == {str(index): f"1/{index}" for index in range(1, 8)}
+    assert columns[IF_ALIAS] == {str(index): f"client_{index}" for index in range(1, 4)}
+
+
+def test_get_columns_pages_across_getbulk_requests():
+    session = FakeSession(make_table())
+    fetcher = SnmpTableFetcher(session, max_repetitions=2)
+    column = fetcher.get_column(IF_NAME + '.')
+
+    assert len(column) == 7
+    assert session.bulk_calls == 4
+    assert fetcher.request_count == session.bulk_calls
+
+
+def test_get_columns_walks_each_column_over_snmpv1():
+    session = FakeSession(make_table())
+    session.version = 1
+    columns = SnmpTableFetcher(session).get_columns([IF_NAME, IF_ALIAS])
+
+    assert columns[IF_ALIAS] == {str(index): f"client_{index}" for index in range(1, 4)}
+    assert len(columns[IF_NAME]) == 7
+    assert session.walks == [IF_NAME, IF_ALIAS]
+    assert session.bulk_calls == 0
+
+
+def test_session_pool_opens_numeric_sessions():
+    opened = []
+    pool = SessionPool(lambda **options: opened.append(options) or object())
+    with pool.session('10.0.0.1', 'public', 2, use_enums=True):
+        pass
+
+    assert opened[0]['use_numeric'] is True
+    assert opened[0]['use_enums'] is True
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def factory(**options):
+        session = types.SimpleNamespace(**options)
+        opened.append(session)
+        return session
+    return SessionPool(factory, **kwargs), opened
+
+
+def test_session_pool_reuses_returned_sessions_per_device():
+    pool, opened = make_pool()
+    with pool.session('10.9.0.1', 'public', 2) as first:
+        pass
+    with pool.session('10.9.0.1', 'public', 2) as second:
+        with pool.session('10.9.0.1', 'public', 2) as third:
+            pass
+
+    assert second is first
+    assert third is not first
+    assert len(opened) == 2
+    assert pool.idle_count == 0
+    pool._drain_returned()
+    assert pool.idle_count == 2
+
+
+def test_session_pool_replaces_sessions_with_stale_timeout():
+    pool, opened = make_pool()
+    with pool.session('10.9.0.2', 'public', 2) as session:
+        session.timeout *= 4
+    with pool.session('10.9.0.2', 'public', 2) as replacement:
+        pass
+
+    assert replacement is not session
+    assert len(opened) == 2
+
+
+def test_session_pool_evicts_oldest_and_expired_sessions():
+    pool, opened = make_pool(max_idle=1)
+    for ip in ('10.9.0.3', '10.9.0.4'):
+        with pool.session(ip, 'public', 2):
+            pass
+    with pool.session('10.9.0.5', 'public', 2):
+        pass
+    assert pool.idle_count == 1
+    assert [key[0] for key in pool.idle] == ['10.9.0.4']
+
+    pool.idle_timeout = 0
+    with pool.session('10.9.0.4', 'public', 2) as session:
+        pass
+    assert session is not opened[1]
+
+
+def test_plan_requests_groups_columns_within_varbind_limit():
+    profile = OidProfile("test", {'if_name': IF_NAME, 'alias': IF_ALIAS, 'oper_status': IF_OPER_STATUS_OID, 'duplicate': IF_NAME},
+                         max_repetitions=25, max_varbinds=50)
+
+    assert plan_requests(profile, ['if_name', 'alias', 'oper_status', 'duplicate']) == [[IF_NAME, IF_ALIAS], [IF_OPER_STATUS_OID]]
+    assert plan_requests(profile.derive("narrow", max_varbinds=10), ['if_name', 'alias']) == [[IF_NAME], [IF_ALIAS]]
+
+
+def test_device_snapshot_fetches_profile_columns_once():
+    table = make_table()
+    table.update({f"1.3.6.1.4.1.3320.1.{index}.{index}": f"up{index}" for index in range(1, 3)})
+    profile = OidProfile("test", {'if_name': IF_NAME, 'alias': IF_ALIAS, 'state': "1.3.6.1.4.1.3320.1"},
+                         index={'state': INDEX_LAST}, port_pattern=r"1/(\d+)", max_repetitions=10, max_varbinds=30)
+    session = FakeSession(table)
+    snapshot = DeviceSnapshot(SnmpTableFetcher(session, max_repetitions=10), profile)
+
+    assert snapshot.alias == {index: f"client_{index}" for index in range(1, 4)}
+    assert snapshot.column('state') == {1: "up1", 2: "up2"}
+    assert snapshot.port_count == 7
+    assert session.bulk_calls == 1
+
+
+def test_device_timeouts_follow_smoothed_rtt():
+    timeouts = DeviceTimeouts(min_timeout=0.5, max_timeout=30.0, initial_timeout=2.0)
+    assert timeouts.timeout('10.0.0.1') == 2.0
+    timeouts.record_rtt('10.0.0.1', 0.2)
+    assert timeouts.timeout('10.0.0.1') == pytest.approx(0.6)
+    timeouts.record_timeout('10.0.0.1')
+    assert timeouts.timeout('10.0.0.1') == pytest.approx(1.2)
+    timeouts.record_rtt('10.0.0.1', 0.2)
+    assert timeouts.timeout('10.0.0.1') == pytest.approx(0.5)
+
+
+def test_device_timeouts_accept_rtt_after_first_timeout():
+    timeouts = DeviceTimeouts(initial_timeout=2.0, max_timeout=30.0)
+    timeouts.record_timeout('10.0.0.1')
+    assert timeouts.timeout('10.0.0.1') == 4.0
+    timeouts.record_rtt('10.0.0.1', 1.0)
+    assert timeouts.timeout('10.0.0.1') == 3.0
@@ -0,0 +1,69 @@
+import datetime
+import json
+
+import pytest
+
+from state_utils import TriggerStateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TriggerStateStore(str(tmp_path / "triggers.db"), str(tmp_path / "missing.json"))
+
+
+def make_trigger(trigger_id, host_name='sw-zr-no-1.te.clb'):
+    return {
+        'trigger_id': trigger_id,
+        'host_name': host_name,
+        'region': 'TE',
+        'description': 'No main power -',
+        'last_change_datetime': datetime.datetime(2024, 2, 20, 4, 34, 40),
+    }
+
+
+def test_open_and_close_round_trip(store):
+    store.open([make_trigger('1'), make_trigger('2')], pushed=True)
+    assert store.ids() == {'1', '2'}
+    assert store.pushed_ids() == {'1', '2'}
+
+    records = store.close(['1', 'unknown'])
+
+    assert [record['trigger_id'] for record in records] == ['1']
+    assert records[0]['opened_datetime'] == datetime.datetime(2024, 2, 20, 4, 34, 40)
+    assert store.ids() == {'2'}
+
+
+def test_transaction_rolls_back_on_error(store):
+    with pytest.raises(RuntimeError):
+        with store.transaction() as connection:
+            assert connection.in_transaction
+            connection.execute("INSERT INTO triggers (trigger_id) VALUES ('1')")
+            raise RuntimeError("збій посеред запису")
+
+    assert store.ids() == set()
+    assert not store.connection.in_transaction
+
+
+def test_legacy_ids_are_migrated_and_backfilled(tmp_path):
+    legacy_path = tmp_path / "previous_triggers.json"
+    legacy_path.write_text(json.dumps(['1', '2']))
+    store = TriggerStateStore(str(tmp_path / "triggers.db"), str(legacy_path))
+    assert store.ids() == {'1', '2'}
+
+    store.fill_missing([make_trigger('1')])
+    records = {record['trigger_id']: record for record in store.close(['1', '2'])}
+
+    assert records['1']['host_name'] == 'sw-zr-no-1.te.clb'
+    assert records['1']['region'] == 'TE'
+    assert records['2']['host_name'] is None
+
+
+def test_legacy_ids_are_not_migrated_again_after_restart(tmp_path):
+    legacy_path = tmp_path / "previous_triggers.json"
+    legacy_path.write_text(json.dumps(['111', '222']))
+    store = TriggerStateStore(str(tmp_path / "triggers.db"), str(legacy_path))
+    store.close(['111', '222'])
+    store.connection.close()
+
+    restarted = TriggerStateStore(str(tmp_path / "triggers.db"), str(legacy_path))
+    assert restarted.ids() == set()
@@ -0,0 +1,23 @@
+import pytest
+
+from reachability_utils import DeviceUnreachable
+from topology_utils import TopologyTraversal
+
+
+def raise_driver_error(ip):
+    raise ValueError("драйвер не розібрав відповідь")
+
+
+def test_visit_reports_driver_errors_but_not_timeouts():
+    forgotten = []
+    with pytest.raises(ValueError):
+        TopologyTraversal(raise_driver_error, on_driver_error=forgotten.append).visit('10.0.0.1')
+
+    assert TopologyTraversal(lambda ip: None, on_driver_error=forgotten.append).visit('10.0.0.2') == (0, {})
+
+    def timeout(ip):
+        raise TimeoutError("timed out")
+
+    with pytest.raises(DeviceUnreachable):
+        TopologyTraversal(timeout, on_driver_error=forgotten.append).visit('10.0.0.3')
+    assert forgotten == ['10.0.0.1']
@@ -0,0 +1,64 @@
+import json
+
+from vendor_utils import DriverProfile, DriverRegistry
+
+
+def make_registry(tmp_path):
+    registry = DriverRegistry(str(tmp_path / "vendor_cache.json"))
+    registry.register(DriverProfile("dlink", "D-Link", object, descr_any=("DES-",)))
+    return registry
+
+
+def test_detect_defers_save_until_save_if_dirty(tmp_path):
+    registry = make_registry(tmp_path)
+    probes = []
+
+    def probe(ip):
+        probes.append(ip)
+        return "DES-3200-28", ""
+
+    assert registry.detect("10.0.0.1", probe).name == "dlink"
+    assert registry.detect("10.0.0.2", probe).name == "dlink"
+    assert registry.detect("10.0.0.1", probe).name == "dlink"
+    assert probes == ["10.0.0.1", "10.0.0.2"]
+    assert not (tmp_path / "vendor_cache.json").exists()
+
+    assert registry.save_if_dirty()
+    assert not registry.save_if_dirty()
+    with open(tmp_path / "vendor_cache.json") as file:
+        assert set(json.load(file)) == {"10.0.0.1", "10.0.0.2"}
+
+
+def test_save_merges_entries_from_other_processes(tmp_path):
+    first, second = make_registry(tmp_path), make_registry(tmp_path)
+    first.detect("10.0.0.1", lambda ip: ("DES-3200-28", ""))
+    second.detect("10.0.0.2", lambda ip: ("DES-1210-28", ""))
+    first.save_if_dirty()
+    second.save_if_dirty()
+    with open(tmp_path / "vendor_cache.json") as file:
+        cache = json.load(file)
+    assert cache["10.0.0.1"]["sys_descr"] == "DES-3200-28"
+    assert cache["10.0.0.2"]["sys_descr"] == "DES-1210-28"
+
+
+def test_unrecognised_devices_are_probed_again_after_negative_ttl(tmp_path):
+    registry = make_registry(tmp_path)
+    answers = iter([("", ""), ("DES-3200-28", "")])
+    assert registry.detect("10.0.0.1", lambda ip: next(answers)) is None
+    assert registry.cached("10.0.0.1") is not None
+
+    registry.cache["10.0.0.1"]['updated'] -= registry.negative_ttl + 1
+    assert registry.cached("10.0.0.1") is None
+    assert registry.detect("10.0.0.1", lambda ip: next(answers)).name == "dlink"
+    registry.cache["10.0.0.1"]['updated'] -= registry.negative_ttl + 1
+    assert registry.cached("10.0.0.1") is not None
+
+
+def test_forget_drops_the_device_from_disk(tmp_path):
+    registry = make_registry(tmp_path)
+    registry.detect("10.0.0.1", lambda ip: ("DES-3200-28", ""))
+    registry.save_if_dirty()
+    registry.forget("10.0.0.1")
+
+    assert registry.cached("10.0.0.1") is None
+    assert "10.0.0.1" not in make_registry(tmp_path).cache
@@ -0,0 +1,82 @@
+import asyncio
+import datetime
+
+from webhook_utils import SAMPLE_EVENTS, WebhookReceiver, parse_event, send_event
+
+
+def test_parse_event_problem_and_recovery():
+    kind, trigger = parse_event(SAMPLE_EVENTS[0])
+    assert kind == 'problem'
+    assert trigger['trigger_id'] == '485544'
+    assert trigger['host_name'] == 'sw-zr-no-1.te.clb'
+    assert trigger['last_change_datetime'] == datetime.datetime(2024, 2, 20, 4, 34, 40)
+
+    kind, trigger = parse_event(SAMPLE_EVENTS[1])
+    assert kind == 'resolved'
+    assert trigger['last_change_datetime'] == datetime.datetime(2024, 2, 20, 5, 10, 2)
+
+
+def run_receiver(scenario):
+    async def run():
+        queue = asyncio.Queue()
+        receiver = WebhookReceiver(queue, '127.0.0.1', 0)
+        await receiver.start()
+        port = receiver.server.sockets[0].getsockname()[1]
+        try:
+            return await scenario(queue, port)
+        finally:
+            await receiver.close()
+    return asyncio.run(run())
+
+
+def test_receiver_queues_sample_events():
+    async def scenario(queue, port):
+        statuses = [await send_event('127.0.0.1', port, payload) for payload in SAMPLE_EVENTS]
+        events = [queue.get_nowait() for _ in SAMPLE_EVENTS]
+        return statuses, events
+
+    statuses, events = run_receiver(scenario)
+
+    assert all(' 202 ' in status for status in statuses)
+    assert [kind for kind, _ in events] == ['problem', 'resolved']
+
+
+def test_receiver_rejects_unknown_path_and_invalid_event():
+    async def scenario(queue, port):
+        not_found = await send_event('127.0.0.1', port, SAMPLE_EVENTS[0], path='/other')
+        bad_request = await send_event('127.0.0.1', port, {'event_value': '1'})
+        return not_found, bad_request, queue.qsize()
+
+    not_found, bad_request, queued = run_receiver(scenario)
+
+    assert ' 404 ' in not_found
+    assert ' 400 ' in bad_request
+    assert queued == 0
+
+
+async def send_raw(port, request):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request)
+    await writer.drain()
+    if writer.can_write_eof():
+        writer.write_eof()
+    status_line = (await reader.readline()).decode().strip()
+    writer.close()
+    return status_line
+
+
+def test_receiver_answers_400_to_malformed_requests():
+    requests = [
+        b"POST /zabbix HTTP/1.1\r\nContent-Length: abc\r\n\r\n{}",
+        b"POST /zabbix HTTP/1.1\r\nContent-Length: 100\r\n\r\n{}",
+        b"POST /zabbix HTTP/1.1\r\nContent-Length: 2\r\n\r\n[]",
+        b"POST /zabbix HTTP/1.1\r\nContent-Length: 3\r\n\r\nxyz",
+    ]
+
+    async def scenario(queue, port):
+        return [await send_raw(port, request) for request in requests], queue.qsize()
+
+    statuses, queued = run_receiver(scenario)
+
+    assert all(' 400 ' in status for status in statuses)
+    assert queued == 0
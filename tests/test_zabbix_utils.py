@@ -0,0 +1,97 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("requests")
+
+from zabbix_utils import MyZabbixAPI
+
+
+def make_trigger(trigger_id, value=1, host_name='sw-zr-no-1.te.clb'):
+    return {
+        'trigger_id': trigger_id,
+        'description': 'No main power -',
+        'host_name': host_name,
+        'region': 'TE',
+        'last_change_datetime': datetime.datetime(2024, 2, 20, 4, 34, 40),
+        'value': value,
+    }
+
+
+@pytest.fixture
+def zabbix_api(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    zabbix_api = MyZabbixAPI('http://zabbix.invalid/api_jsonrpc.php', 'user', 'password')
+    zabbix_api.load_previous_triggers()
+    return zabbix_api
+
+
+def new_trigger_info():
+    return {'new_triggers': [], 'resolved_triggers': []}
+
+
+def test_full_poll_closes_pushed_trigger_missing_from_zabbix(zabbix_api):
+    assert zabbix_api.open_pushed_trigger(make_trigger('1'))
+    trigger_info = new_trigger_info()
+
+    zabbix_api.process_full_poll([], trigger_info, poll_time=zabbix_api.pushed_at['1'] + 1)
+
+    assert [record['trigger_id'] for record in trigger_info['resolved_triggers']] == ['1']
+    assert '1' not in zabbix_api.pushed_triggers
+
+
+def test_full_poll_keeps_trigger_pushed_after_poll_started(zabbix_api):
+    assert zabbix_api.open_pushed_trigger(make_trigger('1'))
+    trigger_info = new_trigger_info()
+
+    zabbix_api.process_full_poll([], trigger_info, poll_time=zabbix_api.pushed_at['1'] - 1)
+
+    assert trigger_info['resolved_triggers'] == []
+    assert '1' in zabbix_api.previous_triggers
+
+
+def test_delta_poll_closes_pushed_trigger_on_recovery(zabbix_api):
+    assert zabbix_api.open_pushed_trigger(make_trigger('1'))
+    trigger_info = new_trigger_info()
+
+    zabbix_api.process_delta_poll([make_trigger('1', value=1)], trigger_info)
+    assert trigger_info == new_trigger_info()
+
+    zabbix_api.process_delta_poll([make_trigger('1', value=0)], trigger_info)
+    assert [record['trigger_id'] for record in trigger_info['resolved_triggers']] == ['1']
+
+
+def test_open_pushed_trigger_looks_up_region_outside_state_lock(zabbix_api, monkeypatch):
+    lock_held = []
+    monkeypatch.setattr(zabbix_api, 'get_node_by_host', lambda host_name: lock_held.append(zabbix_api.state_lock.locked()) or 'TE')
+    trigger = make_trigger('1')
+    trigger['region'] = None
+
+    assert zabbix_api.open_pushed_trigger(trigger)
+    assert not zabbix_api.open_pushed_trigger(make_trigger('1'))
+    assert lock_held == [False]
+    assert trigger['region'] == 'TE'
+
+
+def test_close_skips_legacy_rows_without_host(zabbix_api):
+    zabbix_api.trigger_store.connection.execute("INSERT INTO triggers (trigger_id) VALUES ('legacy')")
+    zabbix_api.previous_triggers.add('legacy')
+    trigger_info = new_trigger_info()
+
+    zabbix_api.process_full_poll([], trigger_info)
+
+    assert trigger_info['resolved_triggers'] == []
+    assert 'legacy' not in zabbix_api.previous_triggers
+
+
+def test_client_opens_trigger_store_only_when_polling(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    zabbix_api = MyZabbixAPI('http://zabbix.invalid/api_jsonrpc.php', 'user', 'password')
+    assert zabbix_api.trigger_store is None
+    assert not (tmp_path / "previous_triggers.db").exists()
+
+    monkeypatch.setattr(zabbix_api, 'get_current_triggers', lambda filter_descriptions, since=None: [make_trigger('1')])
+    trigger_info = zabbix_api.process_triggers(['No main power'], [])
+
+    assert [trigger['trigger_id'] for trigger in trigger_info['new_triggers']] == ['1']
+    assert (tmp_path / "previous_triggers.db").exists()
@@ -0,0 +1,224 @@
+from snmp_utils import run_snmp, device_timeouts
+from metrics_utils import metrics
+from reachability_utils import DeviceUnreachable
+from state_utils import interprocess_lock, read_json
+import asyncio
+import json
+import os
+import threading
+import time
+
+
+class TopologyStore:
+    # Граф батько -> нащадки, знайдений під час обходу, зберігається на диску
+    def __init__(self, path="topology.json", max_age=3600):
+        self.path = path
+        self.max_age = max_age
+        self.nodes = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        self.nodes = read_json(self.path, {})
+
+    def save(self):
+        # Інші процеси могли записати свої вузли: об'єднуємо, лишаючи новіші дані
+        with self.lock, interprocess_lock(self.path):
+            for ip, node in read_json(self.path, {}).items():
+                current = self.nodes.get(ip)
+                if current is None or current['updated'] < node['updated']:
+                    self.nodes[ip] = node
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(self.nodes, file)
+            os.replace(tmp_path, self.path)
+
+    def update_node(self, ip, vendor, children, active_users, probed=True):
+        with self.lock:
+            previous = self.nodes.get(ip)
+            self.nodes[ip] = {
+                'vendor': vendor,
+                'children': dict(children),
+                'active_users': active_users,
+                # Час оновлюється лише коли нащадків справді переопитали
+                'updated': time.time() if probed or previous is None else previous['updated']
+            }
+
+    def is_stale(self, ip):
+        node = self.nodes.get(ip)
+        return node is None or time.time() - node['updated'] > self.max_age
+
+    def stale_nodes(self):
+        with self.lock:
+            return [ip for ip in self.nodes if self.is_stale(ip)]
+
+    def get_children(self, ip):
+        node = self.nodes.get(ip)
+        return dict(node['children']) if node else {}
+
+    def get_subtree(self, root_ip):
+        subtree = [root_ip]
+        visited = {root_ip}
+        for ip in subtree:
+            for child_ip in self.get_children(ip).values():
+                if child_ip not in visited:
+                    visited.add(child_ip)
+                    subtree.append(child_ip)
+        return subtree
+
+    def subtree_active_users(self, root_ip):
+        # Оцінка з кешу без опитування: скільки абонентів було під вузлом під час останнього обходу
+        return sum(self.nodes[ip]['active_users'] for ip in self.get_subtree(root_ip) if ip in self.nodes)
+
+
+class TraversalMemo:
+    # Спільні результати обходів у межах одного циклу опитування
+    def __init__(self):
+        self.visits = {}
+        self.subtrees = {}
+
+    async def single_flight(self, table, key, factory):
+        task = table.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            table[key] = task
+
+            def forget_failed(done):
+                # Невдалий результат не кешуємо, щоб повторна спроба пішла в мережу
+                if done.cancelled() or done.exception() is not None:
+                    table.pop(key, None)
+
+            task.add_done_callback(forget_failed)
+        return await asyncio.shield(task)
+
+    async def visit(self, ip, factory):
+        return await self.single_flight(self.visits, ip, factory)
+
+    async def subtree(self, ip, factory):
+        return await self.single_flight(self.subtrees, ip, factory)
+
+
+class TopologyTraversal:
+    def __init__(self, create_switch, max_workers=8, store=None, memo=None, breaker=None, unreachable_errors=(TimeoutError,), on_driver_error=None):
+        self.create_switch = create_switch
+        self.max_workers = max_workers
+        self.store = store
+        self.memo = memo
+        self.breaker = breaker
+        self.unreachable_errors = unreachable_errors
+        self.on_driver_error = on_driver_error
+
+    def visit(self, ip, refresh=False):
+        if self.breaker is not None and not self.breaker.allow(ip):
+            metrics.inc('breaker_skips_total')
+            raise DeviceUnreachable(ip, "запобіжник розімкнено")
+
+        start = time.perf_counter()
+        unreachable = False
+        try:
+            switch_object = self.create_switch(ip)
+            if switch_object is None:
+                metrics.observe('device_visit_seconds', time.perf_counter() - start, vendor="unknown")
+                return 0, {}
+
+            active_user_count = switch_object.count_active_user()
+            probed = self.store is None or refresh or self.store.is_stale(ip)
+            if probed:
+                lower_switch_ips = switch_object.get_switches()
+            else:
+                # Свіжі дані про нащадків беремо зі сховища без опитування FDB і Zabbix
+                lower_switch_ips = self.store.get_children(ip)
+        except self.unreachable_errors as e:
+            # Таймаут обходу враховується лише тут: далі він іде як DeviceUnreachable
+            unreachable = True
+            device_timeouts.record_timeout(ip)
+            metrics.inc('snmp_timeouts_total', device=ip)
+            raise DeviceUnreachable(ip, str(e)) from e
+        except Exception:
+            # Драйвер не впорався з пристроєм (можливо, тип визначено хибно): кеш вендора скидається
+            if self.on_driver_error is not None:
+                self.on_driver_error(ip)
+            raise
+        finally:
+            # Кожен візит завершує пробну спробу: пристрій або не відповів, або відповів
+            # (навіть якщо драйвер не знайшовся чи впав), інакше запобіжник лишився б напіввідкритим
+            if self.breaker is not None:
+                if unreachable:
+                    self.breaker.record_failure(ip)
+                else:
+                    self.breaker.record_success(ip)
+        if self.store is not None:
+            self.store.update_node(ip, type(switch_object).__name__, lower_switch_ips, active_user_count, probed)
+        print(ip, "SNMP запитів:", switch_object.snmp.request_count)
+        metrics.observe('device_visit_seconds', time.perf_counter() - start, vendor=type(switch_object).__name__)
+        return active_user_count, lower_switch_ips
+
+    async def traverse(self, root_ip):
+        with metrics.span('traversal_seconds'):
+            if self.memo is not None:
+                return await self.memo.subtree(root_ip, lambda: self._traverse(root_ip))
+            return await self._traverse(root_ip)
+
+    async def _traverse(self, root_ip):
+        # Обхід дерева в ширину: кожен рівень опитується паралельно.
+        # Повертає також недоступні вузли, піддерева яких не враховано
+        switch_users = {}
+        skipped = []
+        visited = {root_ip}
+        level = [root_ip]
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def visit_limited(ip):
+            async with semaphore:
+                return await run_snmp(self.visit, ip)
+
+        if self.memo is not None:
+            visit_once = visit_limited
+
+            async def visit_limited(ip):
+                return await self.memo.visit(ip, lambda: visit_once(ip))
+
+        async def visit_or_skip(ip):
+            try:
+                return await visit_limited(ip)
+            except DeviceUnreachable as e:
+                if ip == root_ip:
+                    raise
+                print(e)
+                skipped.append(ip)
+                return None
+
+        while level:
+            next_level = []
+            results = await asyncio.gather(*(visit_or_skip(ip) for ip in level))
+            for ip, result in zip(level, results):
+                if result is None:
+                    continue
+                active_user_count, lower_switch_ips = result
+                switch_users[ip] = active_user_count
+                for lower_switch_ip in lower_switch_ips.values():
+                    if lower_switch_ip not in visited:
+                        visited.add(lower_switch_ip)
+                        next_level.append(lower_switch_ip)
+            level = next_level
+
+        if self.store is not None:
+            await asyncio.to_thread(self.store.save)
+
+        return sum(switch_users.values()), switch_users, skipped
+
+    async def refresh_stale(self):
+        # Повторно опитати лише ті вузли, дані яких застаріли
+        stale_ips = self.store.stale_nodes()
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def refresh_limited(ip):
+            async with semaphore:
+                try:
+                    await run_snmp(self.visit, ip, True)
+                except Exception as e:
+                    print(f"Не вдалося оновити топологію {ip}: {e}")
+
+        await asyncio.gather(*(refresh_limited(ip) for ip in stale_ips))
+        await asyncio.to_thread(self.store.save)
+        return len(stale_ips)
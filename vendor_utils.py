@@ -0,0 +1,125 @@
+from snmp_utils import normalize_oid
+from state_utils import interprocess_lock, read_json
+import json
+import os
+import threading
+import time
+
+SYS_DESCR_OID = "1.3.6.1.2.1.1.1.0"
+SYS_OBJECT_ID_OID = "1.3.6.1.2.1.1.2.0"
+
+
+class DriverProfile:
+    def __init__(self, name, vendor, driver_class, descr_all=(), descr_any=(), descr_none=(), object_ids=(), args=()):
+        self.name = name
+        self.vendor = vendor
+        self.driver_class = driver_class
+        self.descr_all = descr_all
+        self.descr_any = descr_any
+        self.descr_none = descr_none
+        self.object_ids = [normalize_oid(object_id) for object_id in object_ids]
+        self.args = args
+
+    def matches(self, sys_descr, sys_object_id=''):
+        sys_object_id = normalize_oid(sys_object_id)
+        if sys_object_id and any(sys_object_id.startswith(object_id) for object_id in self.object_ids):
+            return True
+        if not self.descr_all and not self.descr_any:
+            return False
+        if not all(pattern in sys_descr for pattern in self.descr_all):
+            return False
+        if self.descr_any and not any(pattern in sys_descr for pattern in self.descr_any):
+            return False
+        return not any(pattern in sys_descr for pattern in self.descr_none)
+
+    def create(self, ip, community, version, core_mac_address, zabbix_url, zabbix_user, zabbix_password):
+        return self.driver_class(ip, community, version, core_mac_address, zabbix_url, zabbix_user, zabbix_password, *self.args)
+
+
+class DriverRegistry:
+    # Профілі драйверів і кеш IP -> профіль, що зберігається на диску
+    def __init__(self, cache_path="vendor_cache.json", ttl=86400, negative_ttl=600):
+        self.profiles = []
+        self.cache_path = cache_path
+        self.ttl = ttl
+        # Нерозпізнаний пристрій (порожній чи незнайомий sysDescr) перевіряється знову значно раніше
+        self.negative_ttl = negative_ttl
+        self.cache = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def register(self, profile):
+        self.profiles.append(profile)
+        return profile
+
+    def get_profile(self, name):
+        for profile in self.profiles:
+            if profile.name == name:
+                return profile
+        return None
+
+    def match(self, sys_descr, sys_object_id=''):
+        for profile in self.profiles:
+            if profile.matches(sys_descr, sys_object_id):
+                return profile
+        return None
+
+    def load(self):
+        self.cache = read_json(self.cache_path, {})
+
+    def save(self):
+        # Інші процеси могли визначити свої пристрої: об'єднуємо, лишаючи новіші записи
+        with self.lock, interprocess_lock(self.cache_path):
+            for ip, entry in read_json(self.cache_path, {}).items():
+                current = self.cache.get(ip)
+                if current is None or current['updated'] < entry['updated']:
+                    self.cache[ip] = entry
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(self.cache, file)
+            os.replace(tmp_path, self.cache_path)
+
+    def save_if_dirty(self):
+        # Нові визначення записуються на диск один раз за цикл опитування, а не на кожен пристрій
+        with self.lock:
+            if not self.dirty:
+                return False
+            self.dirty = False
+        self.save()
+        return True
+
+    def cached(self, ip):
+        entry = self.cache.get(ip)
+        if entry and time.time() - entry['updated'] <= (self.ttl if entry['profile'] else self.negative_ttl):
+            return entry
+        return None
+
+    def detect(self, ip, probe):
+        # Повертає профіль з кешу або опитує sysDescr/sysObjectID
+        entry = self.cached(ip)
+        if entry is not None:
+            return self.get_profile(entry['profile']) if entry['profile'] else None
+
+        sys_descr, sys_object_id = probe(ip)
+        print(sys_descr)
+        profile = self.match(sys_descr, sys_object_id)
+        with self.lock:
+            self.cache[ip] = {
+                'profile': profile.name if profile else None,
+                'sys_descr': sys_descr,
+                'updated': time.time()
+            }
+            self.dirty = True
+        return profile
+
+    def forget(self, ip):
+        # Видаляємо і з файлу, інакше об'єднання при save поверне запис
+        with self.lock, interprocess_lock(self.cache_path):
+            self.cache.pop(ip, None)
+            cache = read_json(self.cache_path, {})
+            if cache.pop(ip, None) is not None:
+                tmp_path = self.cache_path + ".tmp"
+                with open(tmp_path, "w") as file:
+                    json.dump(cache, file)
+                os.replace(tmp_path, self.cache_path)
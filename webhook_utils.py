@@ -0,0 +1,122 @@
+import asyncio
+import datetime
+import json
+import sys
+
+
+def parse_event(payload):
+    # Параметри медіа-типу Webhook у Zabbix:
+    # event_value={EVENT.VALUE}, trigger_id={TRIGGER.ID}, trigger_description={TRIGGER.NAME},
+    # host_name={HOST.NAME}, event_clock={EVENT.TIMESTAMP} або event_date/event_time
+    if str(payload.get('event_value', '1')) == '0':
+        kind = 'resolved'
+        event_date = payload.get('recovery_date') or payload.get('event_date')
+        event_time = payload.get('recovery_time') or payload.get('event_time')
+    else:
+        kind = 'problem'
+        event_date = payload.get('event_date')
+        event_time = payload.get('event_time')
+
+    if payload.get('event_clock'):
+        event_datetime = datetime.datetime.fromtimestamp(int(payload['event_clock']))
+    elif event_date and event_time:
+        event_datetime = datetime.datetime.strptime(f"{event_date} {event_time}", '%Y.%m.%d %H:%M:%S')
+    else:
+        event_datetime = datetime.datetime.now()
+
+    trigger = {
+        'trigger_id': str(payload['trigger_id']),
+        'description': payload.get('trigger_description', ''),
+        'host_name': payload['host_name'],
+        'region': None,
+        'last_change_datetime': event_datetime
+    }
+    return kind, trigger
+
+
+class WebhookReceiver:
+    def __init__(self, queue, host='127.0.0.1', port=8080, path='/zabbix'):
+        self.queue = queue
+        self.host = host
+        self.port = port
+        self.path = path
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"Webhook слухає http://{self.host}:{self.port}{self.path}")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            if len(request_line) < 2 or request_line[0] != 'POST' or request_line[1] != self.path:
+                await self.respond(writer, 404, 'Not Found')
+                return
+
+            try:
+                content_length = int(headers.get('content-length', 0))
+                if content_length < 0:
+                    raise ValueError("від'ємний Content-Length")
+                payload = json.loads(await reader.readexactly(content_length))
+                if not isinstance(payload, dict):
+                    raise ValueError("тіло події має бути JSON-об'єктом")
+                event = parse_event(payload)
+            except (ValueError, KeyError, asyncio.IncompleteReadError) as e:
+                print("Некоректна подія webhook:", e)
+                await self.respond(writer, 400, 'Bad Request')
+                return
+
+            await self.queue.put(event)
+            await self.respond(writer, 202, 'Accepted')
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, reason):
+        body = reason.encode()
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            # Клієнт уже закрив з'єднання
+            pass
+
+
+async def send_event(host, port, payload, path='/zabbix'):
+    # Локальна заміна Zabbix для перевірки приймача
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(payload).encode()
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status_line = (await reader.readline()).decode().strip()
+    writer.close()
+    return status_line
+
+
+SAMPLE_EVENTS = [
+    {'event_value': '1', 'trigger_id': '485544', 'trigger_description': 'No main power -',
+     'host_name': 'sw-zr-no-1.te.clb', 'event_date': '2024.02.20', 'event_time': '04:34:40'},
+    {'event_value': '0', 'trigger_id': '485544', 'trigger_description': 'No main power -',
+     'host_name': 'sw-zr-no-1.te.clb', 'recovery_date': '2024.02.20', 'recovery_time': '05:10:02'},
+]
+
+
+async def send_sample_events(host, port):
+    for payload in SAMPLE_EVENTS:
+        print(await send_event(host, port, payload))
+
+
+if __name__ == "__main__":
+    asyncio.run(send_sample_events(sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1', int(sys.argv[2]) if len(sys.argv) > 2 else 8080))
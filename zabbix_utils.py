@@ -1,9 +1,36 @@
-from pyzabbix import ZabbixAPI
 import requests
-import json
 import time
 import datetime
 import re
+import threading
+from state_utils import TriggerStateStore
+from naming_utils import transform_host_name
+from metrics_utils import metrics
+
+ZABBIX_API_URL = 'https://zabbix6.columbus.te.ua/api_jsonrpc.php'
+SESSION_EXPIRED_MARKERS = ("re-login", "Not authorised", "Not authorized")
+POLL_OVERLAP = 60
+
+
+def is_session_expired(error):
+    if not error:
+        return False
+    error_text = f"{error.get('message', '')} {error.get('data', '')}"
+    return any(marker in error_text for marker in SESSION_EXPIRED_MARKERS)
+
+
+def region_from_groups(host_name, groups):
+    for group in groups:
+        if "[Network]/Тернопіль/Columbus" in group["name"]:
+            return "TE"
+        elif "[Network]/Тернопіль/Bitternet" in group["name"]:
+            return "TEO"
+        elif "[Network]/Червоноград/Володимир" in group["name"] and "-vv-" in host_name:
+            return "VV"
+        elif "-cg-" in host_name:
+            return "CG"
+    return None
+
 
 class MyZabbixAPI:
     def __init__(self, api_url, username, password):
@@ -11,8 +38,17 @@ class MyZabbixAPI:
         self.username = username
         self.password = password
         self.auth_token = None
+        self.http = requests.Session()
+        self.login_lock = threading.Lock()
+        self.region_cache = {}
+        self.state_lock = threading.Lock()
+        self.last_poll_time = None
+        self.polls_since_full = 0
+        self.full_poll_every = 10
+        self.trigger_store = None
         self.previous_triggers = set()
-        self.load_previous_triggers()
+        self.pushed_triggers = set()
+        self.pushed_at = {}
 
     def login(self):
         login_data = {
@@ -25,124 +61,134 @@ class MyZabbixAPI:
             "id": 1,
         }
 
-        response = requests.post(self.api_url, json=login_data)
+        metrics.inc('zabbix_api_calls_total', method="user.login")
+        response = self.http.post(self.api_url, json=login_data)
         auth_result = response.json()
         self.auth_token = auth_result.get('result')
 
         return self.auth_token
 
-    def load_previous_triggers(self):
-        try:
-            with open("previous_triggers.json", "r") as file:
-                self.previous_triggers = set(json.load(file))
-                #print(self.previous_triggers)
-        except FileNotFoundError:
-            pass
-
-    def save_previous_triggers(self):
-        with open("previous_triggers.json", "w") as file:
-            json.dump(list(self.previous_triggers), file)
-
-    def comment_trigger(self, trigger_id, comment):
-        headers = {'Content-Type': 'application/json-rpc'}
-        payload = {
-            "jsonrpc": "2.0",
-            "method": "trigger.update",
-            "params": {
-                "triggerid": trigger_id,
-                "comments": comment
-            },
-            "auth": self.auth_token,
-            "id": 1,
-        }
-        response = requests.post(self.api_url, headers=headers, data=json.dumps(payload))
-        result = response.json()
-        return result
-    
-    def get_node_by_host(self, host_name):
-        auth_token = self.login()
-        host_id = None
-
-        if auth_token:
-            get_hosts_data = {
-                "jsonrpc": "2.0",
-                "method": "host.get",
-                "params": {
-                    "output": ["hostid"],
-                    "filter": {"host": host_name}
-                },
-                "auth": auth_token,
-                "id": 1,
-            }
-
-            response = requests.post(self.api_url, json=get_hosts_data)
-            hosts_result = response.json()
-
-            if 'result' in hosts_result:
-                host_id = hosts_result['result'][0]['hostid']
+    def ensure_login(self, expired_token=None):
+        # Повторний логін лише якщо токена немає або саме він протух
+        with self.login_lock:
+            if self.auth_token is None or self.auth_token == expired_token:
+                self.login()
+        return self.auth_token
 
-        if host_id:
-            group_payload = {
+    def call(self, method, params, request_id=1):
+        for attempt in range(2):
+            auth_token = self.auth_token or self.ensure_login()
+            payload = {
                 "jsonrpc": "2.0",
-                "method": "host.get",
-                "params": {
-                    "output": ["groups"],
-                    "selectGroups": "extend",
-                    "hostids": host_id
-                },
+                "method": method,
+                "params": params,
                 "auth": auth_token,
-                "id": 1
+                "id": request_id,
             }
-            group_response = requests.post(self.api_url, json=group_payload)
-            group_result = group_response.json()
-
-            groups = []
-            if group_result.get("result"):
-                groups = group_result["result"][0]["groups"]
-            node = None
-
-            for group in groups:
-                if "[Network]/Тернопіль/Columbus" in group["name"]:
-                    node = "TE"
-                    break
-                elif "[Network]/Тернопіль/Bitternet" in group["name"]:
-                    node = "TEO"
-                    break
-                elif "[Network]/Червоноград/Володимир" in group["name"] and "-vv-" in host_name:
-                    node = "VV"
-                    break
-                elif "-cg-" in host_name:
-                    node = "CG"
-                    break
+            metrics.inc('zabbix_api_calls_total', method=method)
+            response = self.http.post(self.api_url, json=payload)
+            result = response.json()
+
+            if attempt == 0 and is_session_expired(result.get('error')):
+                self.ensure_login(auth_token)
+                continue
+            return result
+
+    def load_previous_triggers(self, path="previous_triggers.db"):
+        # Сховище відкриває лише клієнт, що опитує тригери; клієнти пошуку IP і регіонів
+        # (зокрема в процесах-обробниках) не тримають власних копій стану
+        with self.state_lock:
+            if self.trigger_store is not None:
+                return
+            self.trigger_store = TriggerStateStore(path)
+            self.previous_triggers = self.trigger_store.ids()
+            self.pushed_triggers = self.trigger_store.pushed_ids()
+
+    def open_triggers(self, triggers, pushed=False):
+        self.trigger_store.open(triggers, pushed)
+        for trigger in triggers:
+            self.previous_triggers.add(trigger['trigger_id'])
+            if pushed:
+                self.pushed_triggers.add(trigger['trigger_id'])
+                self.pushed_at[trigger['trigger_id']] = time.time()
+
+    def close_triggers(self, trigger_ids, solution_datetime):
+        # Дані про хост і регіон беруться зі сховища, без запитів до Zabbix
+        records = self.trigger_store.close(trigger_ids)
+        skipped = [record['trigger_id'] for record in records if not record['host_name']]
+        if skipped:
+            # Записи зі старого previous_triggers.json без хоста: закривати ТД нема за чим
+            print("Тригери без даних про хост не закриваються в білінгу:", skipped)
+            records = [record for record in records if record['host_name']]
+        for trigger_id in trigger_ids:
+            self.previous_triggers.discard(trigger_id)
+            self.pushed_triggers.discard(trigger_id)
+            self.pushed_at.pop(trigger_id, None)
+        for record in records:
+            record['last_change_datetime'] = solution_datetime
+        return records
 
+    def comment_trigger(self, trigger_id, comment):
+        return self.call("trigger.update", {
+            "triggerid": trigger_id,
+            "comments": comment
+        })
+    
+    def get_node_by_host(self, host_name):
+        if host_name in self.region_cache:
+            return self.region_cache[host_name]
+
+        hosts_result = self.call("host.get", {
+            "output": ["host", "name"],
+            "selectGroups": ["name"],
+            "filter": {"host": host_name}
+        })
+
+        if hosts_result.get('result'):
+            host = hosts_result['result'][0]
+            node = region_from_groups(host_name, host.get('groups', []))
+            self.region_cache[host_name] = node
             return node
 
         return "Not found"
 
-                
-
-    def get_current_triggers(self, filter_description):
-        get_triggers_data = {
-            "jsonrpc": "2.0",
-            "method": "trigger.get",
-            "params": {
-                "output": ["triggerid", "description", "lastchange"],
-                "selectHosts": ["name", "hostid"],
-                "search": {"description": filter_description},
-                "expandData": 1,
-                "filter": {"value": 1}
-            },
-            "auth": self.auth_token,
-            "id": 2,
+    def prefetch_regions(self, hosts):
+        # Регіони всіх хостів тригерів одним запитом host.get
+        host_ids = {host['hostid']: host['name'] for host in hosts if host['name'] not in self.region_cache}
+        if not host_ids:
+            return
+
+        hosts_result = self.call("host.get", {
+            "output": ["hostid", "host", "name"],
+            "selectGroups": ["name"],
+            "hostids": list(host_ids)
+        })
+
+        for host in hosts_result.get('result', []):
+            host_name = host_ids.get(host['hostid'], host['name'])
+            self.region_cache[host_name] = region_from_groups(host_name, host.get('groups', []))
+
+    def get_current_triggers(self, filter_descriptions, since=None):
+        params = {
+            "output": ["triggerid", "description", "lastchange", "value"],
+            "selectHosts": ["name", "hostid"],
+            "search": {"description": filter_descriptions},
+            "searchByAny": True,
+            "expandData": 1
         }
-
-        response = requests.post(self.api_url, json=get_triggers_data)
-        trigger_result = response.json()
+        if since is None:
+            params["filter"] = {"value": 1}
+        else:
+            # Лише тригери, що змінили стан після попереднього опитування
+            params["lastChangeSince"] = since
+        trigger_result = self.call("trigger.get", params, request_id=2)
 
         if 'result' in trigger_result:
             trigger_data_list = []
             current_triggers = set()
 
+            self.prefetch_regions([trigger['hosts'][0] for trigger in trigger_result['result'] if trigger['hosts']])
+
             for trigger in trigger_result['result']:
                 trigger_id = trigger['triggerid']
                 current_triggers.add(trigger_id)
@@ -156,7 +202,8 @@ class MyZabbixAPI:
                     'description': trigger['description'],
                     'host_name': host_name,
                     'region': self.get_node_by_host(host_name),
-                    'last_change_datetime': last_change_datetime
+                    'last_change_datetime': last_change_datetime,
+                    'value': int(trigger.get('value', 1))
                 }
 
                 if("olt-cn" not in trigger_data['host_name']):
@@ -168,38 +215,99 @@ class MyZabbixAPI:
             print("No active triggers found for the specified description.")
 
 
-    def process_triggers(self, filter_description, domains):
+    def process_triggers(self, filter_descriptions, domains):
+        self.load_previous_triggers()
+        full_poll = self.last_poll_time is None or self.polls_since_full >= self.full_poll_every
+        poll_time = int(time.time())
+        since = None if full_poll else self.last_poll_time - POLL_OVERLAP
 
-        trigger_data_list = self.get_current_triggers(filter_description)
+        trigger_data_list = self.get_current_triggers(filter_descriptions, since)
         trigger_info = {
         'new_triggers': [],
         'resolved_triggers': []
     }
 
-        current_trigger_ids = {trigger['trigger_id'] for trigger in trigger_data_list}
-
-        new_trigger_ids = current_trigger_ids - self.previous_triggers
-        resolved_trigger_ids = self.previous_triggers - current_trigger_ids
-
-        unresolved_trigger_ids = self.previous_triggers & current_trigger_ids
-
-        for trigger in trigger_data_list:
-            if trigger['trigger_id'] in unresolved_trigger_ids:
-                print(f"{trigger['trigger_id']} - {trigger['host_name']}")
-
-        for trigger in trigger_data_list:
-            if trigger['trigger_id'] in new_trigger_ids and (trigger['host_name'].endswith('.te.clb') or trigger['host_name'].endswith('.te.clb_2')):
-                trigger_info['new_triggers'].append(trigger)
-
-
-        for trigger_id in resolved_trigger_ids:
-            trigger_info['resolved_triggers'].append(trigger)
+        if trigger_data_list is None:
+            return trigger_info
 
-        self.previous_triggers = current_trigger_ids
-        self.save_previous_triggers()
+        if full_poll:
+            self.process_full_poll(trigger_data_list, trigger_info, poll_time)
+            self.polls_since_full = 0
+        else:
+            self.process_delta_poll(trigger_data_list, trigger_info)
+            self.polls_since_full += 1
 
+        self.last_poll_time = poll_time
         return trigger_info
 
+    def process_delta_poll(self, trigger_data_list, trigger_info):
+        with self.state_lock:
+            opened = []
+            for trigger in trigger_data_list:
+                trigger_id = trigger['trigger_id']
+                if trigger_id in self.pushed_triggers and trigger['value'] == 1:
+                    continue
+                # Закриття через опитування спрацьовує і для тригерів з webhook, якщо подія відновлення загубилась
+                if trigger['value'] == 1 and trigger_id not in self.previous_triggers:
+                    opened.append(trigger)
+                    if trigger['host_name'].endswith('.te.clb') or trigger['host_name'].endswith('.te.clb_2'):
+                        trigger_info['new_triggers'].append(trigger)
+                elif trigger['value'] == 0 and trigger_id in self.previous_triggers:
+                    trigger_info['resolved_triggers'].extend(self.close_triggers([trigger_id], trigger['last_change_datetime']))
+            self.open_triggers(opened)
+
+    def process_full_poll(self, trigger_data_list, trigger_info, poll_time=None):
+        current_trigger_ids = {trigger['trigger_id'] for trigger in trigger_data_list}
+        poll_time = time.time() if poll_time is None else poll_time
+
+        with self.state_lock:
+            # Тригери, що прийшли через webhook, вже оброблені
+            new_trigger_ids = current_trigger_ids - self.previous_triggers - self.pushed_triggers
+            # Тригер з webhook закривається, якщо його немає серед активних; крім тих,
+            # що надійшли вже після запиту trigger.get і ще не могли потрапити у відповідь
+            pushed_after_poll = {trigger_id for trigger_id in self.pushed_triggers if self.pushed_at.get(trigger_id, 0) >= poll_time}
+            resolved_trigger_ids = self.previous_triggers - current_trigger_ids - pushed_after_poll
+            unresolved_trigger_ids = self.previous_triggers & current_trigger_ids
+
+            for trigger in trigger_data_list:
+                if trigger['trigger_id'] in unresolved_trigger_ids:
+                    print(f"{trigger['trigger_id']} - {trigger['host_name']}")
+            self.trigger_store.fill_missing([trigger for trigger in trigger_data_list if trigger['trigger_id'] in unresolved_trigger_ids])
+
+            for trigger in trigger_data_list:
+                if trigger['trigger_id'] in new_trigger_ids and (trigger['host_name'].endswith('.te.clb') or trigger['host_name'].endswith('.te.clb_2')):
+                    trigger_info['new_triggers'].append(trigger)
+
+            trigger_info['resolved_triggers'].extend(self.close_triggers(resolved_trigger_ids, datetime.datetime.now()))
+            self.open_triggers([trigger for trigger in trigger_data_list if trigger['trigger_id'] in new_trigger_ids])
+
+            polled_trigger_ids = self.pushed_triggers & current_trigger_ids
+            self.trigger_store.mark_polled(polled_trigger_ids)
+            self.pushed_triggers -= polled_trigger_ids
+            for trigger_id in polled_trigger_ids:
+                self.pushed_at.pop(trigger_id, None)
+
+    def open_pushed_trigger(self, trigger):
+        # Повертає True, якщо тригер ще не відомий і його треба обробити.
+        # Регіон запитується до блокування, щоб повільний Zabbix не зупиняв інші події й опитування
+        self.load_previous_triggers()
+        if trigger['trigger_id'] in self.previous_triggers:
+            return False
+        if not trigger.get('region'):
+            trigger['region'] = self.get_node_by_host(trigger['host_name'])
+        with self.state_lock:
+            if trigger['trigger_id'] in self.previous_triggers:
+                return False
+            self.open_triggers([trigger], pushed=True)
+            return True
+
+    def close_pushed_trigger(self, trigger):
+        # Повертає збережений запис або None, якщо тригер не був відкритий
+        self.load_previous_triggers()
+        with self.state_lock:
+            records = self.close_triggers([trigger['trigger_id']], trigger['last_change_datetime'])
+            return records[0] if records else None
+
     def logout(self):
         logout_data = {
             "jsonrpc": "2.0",
@@ -209,67 +317,105 @@ class MyZabbixAPI:
             "id": 3,
         }
 
-        requests.post(self.api_url, json=logout_data)
+        self.http.post(self.api_url, json=logout_data)
+        self.auth_token = None
+
+
+_zabbix_clients = {}
+_zabbix_clients_lock = threading.Lock()
+
+
+def get_zabbix_api(username, password, api_url=ZABBIX_API_URL):
+    # Один клієнт на процес: спільна HTTP-сесія і токен
+    with _zabbix_clients_lock:
+        zabbix_api = _zabbix_clients.get((api_url, username))
+        if zabbix_api is None:
+            zabbix_api = MyZabbixAPI(api_url, username, password)
+            _zabbix_clients[(api_url, username)] = zabbix_api
+        return zabbix_api
 
 
 def get_zabbix_triggers(username, password, filter_descriptions, domains):
-    api_url = 'https://zabbix6.columbus.te.ua/api_jsonrpc.php'
-    zabbix_api = MyZabbixAPI(api_url, username, password)
-    zabbix_api.login()
-    
-    all_trigger_info = []
-    for filter_description in filter_descriptions:
-        trigger_info = zabbix_api.process_triggers(filter_description, domains)
-        all_trigger_info.append(trigger_info)
-        
-    zabbix_api.logout()
+    zabbix_api = get_zabbix_api(username, password)
     
-    return all_trigger_info
+    return [zabbix_api.process_triggers(list(filter_descriptions), domains)]
 
 
 def get_region(username, password, host):
-    api_url = 'https://zabbix6.columbus.te.ua/api_jsonrpc.php'
-    zabbix_api = MyZabbixAPI(api_url, username, password)
-    zabbix_api.login()
+    zabbix_api = get_zabbix_api(username, password)
     
     return zabbix_api.get_node_by_host(host)
 
 
+class SwitchIpResolver:
+    def __init__(self, zabbix_api, ttl=3600):
+        self.zabbix_api = zabbix_api
+        self.ttl = ttl
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def _store(self, hosts):
+        expires = time.monotonic() + self.ttl
+        with self.lock:
+            for host in hosts:
+                if host.get('interfaces'):
+                    self.cache[host['host']] = (host['interfaces'][0]['ip'], expires)
+
+    def _cached(self, switch_name):
+        entry = self.cache.get(switch_name)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def preload(self):
+        # Завантажити весь інвентар хостів одним запитом
+        hosts_result = self.zabbix_api.call("host.get", {
+            "output": ["host"],
+            "selectInterfaces": ["ip"]
+        })
+        self._store(hosts_result.get('result', []))
+        return len(self.cache)
+
+    def resolve(self, switch_names):
+        missing = [switch_name for switch_name in switch_names if self._cached(switch_name) is None]
+        if missing:
+            hosts_result = self.zabbix_api.call("host.get", {
+                "output": ["host"],
+                "filter": {"host": missing},
+                "selectInterfaces": ["ip"]
+            })
+            self._store(hosts_result.get('result', []))
+
+        switch_ips = {}
+        for switch_name in switch_names:
+            switch_ip = self._cached(switch_name)
+            if switch_ip is not None:
+                switch_ips[switch_name] = switch_ip
+        return switch_ips
+
+
+_switch_ip_resolvers = {}
+
+
+def zabbix_api_url(zabbix_url):
+    if zabbix_url.endswith('api_jsonrpc.php'):
+        return zabbix_url
+    return zabbix_url.rstrip('/') + '/api_jsonrpc.php'
+
+
+def get_switch_ip_resolver(zabbix_url, zabbix_user, zabbix_password):
+    zabbix_api = get_zabbix_api(zabbix_user, zabbix_password, zabbix_api_url(zabbix_url))
+    with _zabbix_clients_lock:
+        resolver = _switch_ip_resolvers.get((zabbix_api.api_url, zabbix_user))
+        if resolver is None:
+            resolver = SwitchIpResolver(zabbix_api)
+            _switch_ip_resolvers[(zabbix_api.api_url, zabbix_user)] = resolver
+        return resolver
+
+
 def get_switch_ip(zabbix_url, zabbix_user, zabbix_password, switch_names):
-    zabbix = ZabbixAPI(zabbix_url)
-    zabbix.login(zabbix_user, zabbix_password)
-
-    switch_ips = {}
-    for switch_name in switch_names:
-        node = zabbix.host.get(filter={'host': switch_name}, selectInterfaces=['ip'])
-        if node and 'interfaces' in node[0]:
-            switch_ip = node[0]['interfaces'][0]['ip']
-            switch_ips[switch_name] = switch_ip
-            
-
-    return switch_ips
-
-
-def transform_host_name(host_name, exceptions):
-    for exception in exceptions:
-        if host_name == exception[0]:
-            return exception[1]
-    parts = host_name.split('.')
-    if len(parts) == 3 and parts[-1] == 'clb':
-        if 'knock-' in parts[0] and 'olt' in parts[0] and '-1' in parts[0]:
-            new_host_name = parts[0].replace('knock-', '') + '.te.clb'
-        else:
-            prefix = parts[0].replace('knock-', '')
-            if 'knock-' in parts[0]:
-                if prefix.startswith('-'):
-                    new_host_name = prefix + '1.te.clb'
-                else:
-                    new_host_name = prefix + '-1.te.clb'
-            else:
-                new_host_name = host_name
-        return new_host_name
-    else:
-        return host_name
+    resolver = get_switch_ip_resolver(zabbix_url, zabbix_user, zabbix_password)
+    return resolver.resolve(switch_names)
 
 
 